@@ -35,7 +35,7 @@ export interface ScheduledTask {
   last_task_id?: string
   error_message?: string
   created_at: string
-  task_config: any
+  task_config?: any
 }
 
 export const createScheduledTask = async (data: ScheduledTaskRequest) => {
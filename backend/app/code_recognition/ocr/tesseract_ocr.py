@@ -8,20 +8,58 @@ import numpy as np
 from typing import List, Dict, Tuple, Optional, Union
 import cv2
 import base64
+import binascii
 import io
 import re
-from PIL import Image
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from PIL import Image, ImageFile
 
 try:
     import pytesseract
-    TESSERACT_AVAILABLE = True
+    PYTESSERACT_AVAILABLE = True
 except ImportError:
-    TESSERACT_AVAILABLE = False
+    PYTESSERACT_AVAILABLE = False
+
+try:
+    # tesserocr直接绑定libtesseract，可复用同一个引擎实例，避免每次调用都启动子进程
+    from tesserocr import PyTessBaseAPI, PSM, OEM, RIL, iterate_level
+    TESSEROCR_AVAILABLE = True
+except ImportError:
+    TESSEROCR_AVAILABLE = False
+
+TESSERACT_AVAILABLE = PYTESSERACT_AVAILABLE or TESSEROCR_AVAILABLE
 
 from app.utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+# 默认配置：优化代码识别的参数，限定可识别字符
+_DEFAULT_OCR_CFG = r'--oem 3 --psm 6 -c tessedit_char_whitelist=0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ!"#$%&\'()*+,-./:;<=>?@[\\]^_`{|}~'
+
+# 代码识别配置。PSM 6: 统一的文本块；OEM 3: 默认，基于LSTM OCR引擎
+_CODE_OCR_CFG = r'--oem 3 --psm 6'
+
+# 代码OCR常见误识别的修正规则，模块加载时编译一次，按顺序逐行应用
+_OCR_FIXES = [
+    # 数字之间的字母O实为0，如 1O24 -> 1024
+    (re.compile(r'(?<=\d)O(?=\d)'), '0'),
+    # 数字之间的l/I实为1，如 2l5 -> 215
+    (re.compile(r'(?<=\d)[lI](?=\d)'), '1'),
+    # 标点前被间距估算插入的多余空格，如 foo(a , b) -> foo(a, b)
+    (re.compile(r'(?<=\S)[ ]+(?=[,;)\]])'), ''),
+]
+
+# 超过该长度的base64输入分块解码并增量送入图像解析器，避免整幅图像的字节副本常驻内存
+_STREAM_DECODE_THRESHOLD = 256 * 1024
+
+# 分块解码的块大小，必须是4的倍数以对齐base64分组
+_B64_CHUNK_SIZE = 64 * 1024
+
+# 预处理变体的平均置信度达到该阈值时直接采用，不再尝试后续变体
+EARLY_EXIT_CONFIDENCE = 0.90
+
 class TesseractOCRService:
     def __init__(self, tesseract_cmd: Optional[str] = None, lang: str = 'eng'):
         """
@@ -32,20 +70,41 @@ class TesseractOCRService:
             lang: 语言设置，默认为英文
         """
         self.lang = lang
+        self.tesseract_cmd = tesseract_cmd
         self.is_initialized = False
+        self._api = None
+        # PyTessBaseAPI不是线程安全的，所有调用需串行化
+        self._api_lock = threading.Lock()
+        # 每个线程独立的预处理中间缓冲区，按见过的最大图像尺寸复用
+        self._scratch = threading.local()
         
         if not TESSERACT_AVAILABLE:
-            logger.warning("pytesseract未安装，无法使用Tesseract OCR服务")
+            logger.warning("pytesseract和tesserocr均未安装，无法使用Tesseract OCR服务")
             return
         
         # 设置Tesseract路径
-        if tesseract_cmd:
+        if tesseract_cmd and PYTESSERACT_AVAILABLE:
             pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
         
         self._initialize_service()
     
     def _initialize_service(self):
         """初始化OCR服务"""
+        if TESSEROCR_AVAILABLE:
+            try:
+                # 创建常驻的Tesseract引擎，语言模型只加载一次
+                self._api = PyTessBaseAPI(lang=self.lang, psm=PSM.SINGLE_BLOCK, oem=OEM.DEFAULT)
+                self.is_initialized = True
+                logger.info(f"Tesseract OCR初始化成功（tesserocr），版本: {self._api.Version()}")
+                return
+            except Exception as e:
+                logger.warning(f"tesserocr初始化失败，回退到pytesseract: {str(e)}")
+                self._api = None
+        
+        if not PYTESSERACT_AVAILABLE:
+            self.is_initialized = False
+            return
+        
         try:
             # 测试Tesseract是否可用
             version = pytesseract.get_tesseract_version()
@@ -87,13 +146,20 @@ class TesseractOCRService:
             
             # 设置默认配置
             if config is None:
-                config = self._get_default_config()
-            
-            # 执行OCR识别
-            text_result = pytesseract.image_to_string(pil_image, lang=self.lang, config=config)
+                config = _DEFAULT_OCR_CFG
             
-            # 获取详细结果（包含坐标和置信度）
-            detailed_data = pytesseract.image_to_data(pil_image, lang=self.lang, config=config, output_type=pytesseract.Output.DICT)
+            if self._api is not None:
+                # 复用常驻引擎，一次识别同时得到文本和逐词结果
+                text_result, detailed_data = self._recognize_with_api(pil_image, config)
+            else:
+                # pytesseract会按图像格式写临时文件，BMP无需压缩，比默认的PNG编码快得多
+                pil_image.format = 'BMP'
+                
+                # 执行OCR识别
+                text_result = pytesseract.image_to_string(pil_image, lang=self.lang, config=config)
+                
+                # 获取详细结果（包含坐标和置信度）
+                detailed_data = pytesseract.image_to_data(pil_image, lang=self.lang, config=config, output_type=pytesseract.Output.DICT)
             
             # 处理详细结果
             detailed_results = self._process_detailed_results(detailed_data)
@@ -115,16 +181,95 @@ class TesseractOCRService:
                 'detailed_results': []
             }
     
-    def _process_input_image(self, image: Union[np.ndarray, str]) -> Optional[Image.Image]:
-        """处理输入图像"""
+    def _recognize_with_api(self, pil_image: Image.Image, config: str) -> Tuple[str, Dict]:
+        """
+        使用常驻的PyTessBaseAPI识别图像
+        
+        Args:
+            pil_image: 待识别的PIL图像
+            config: Tesseract命令行风格的配置参数
+            
+        Returns:
+            (识别文本, 与pytesseract.image_to_data相同结构的逐词结果字典)
+        """
+        psm, variables = self._parse_config(config)
+        data = {key: [] for key in ('text', 'conf', 'left', 'top', 'width', 'height',
+                                    'word_num', 'line_num', 'par_num')}
+        
+        with self._api_lock:
+            self._api.SetPageSegMode(psm)
+            # 变量会保留在引擎上，未指定的白名单需显式清空
+            variables.setdefault('tessedit_char_whitelist', '')
+            for name, value in variables.items():
+                self._api.SetVariable(name, value)
+            
+            self._set_api_image(pil_image)
+            self._api.Recognize()
+            text = self._api.GetUTF8Text()
+            
+            par_num = line_num = word_num = 0
+            iterator = self._api.GetIterator()
+            for word in iterate_level(iterator, RIL.WORD):
+                if word.IsAtBeginningOf(RIL.PARA):
+                    par_num += 1
+                if word.IsAtBeginningOf(RIL.TEXTLINE):
+                    line_num += 1
+                    word_num = 0
+                word_num += 1
+                
+                bbox = word.BoundingBox(RIL.WORD)
+                if bbox is None:
+                    continue
+                x1, y1, x2, y2 = bbox
+                data['text'].append(word.GetUTF8Text(RIL.WORD) or '')
+                data['conf'].append(word.Confidence(RIL.WORD))
+                data['left'].append(x1)
+                data['top'].append(y1)
+                data['width'].append(x2 - x1)
+                data['height'].append(y2 - y1)
+                data['word_num'].append(word_num)
+                data['line_num'].append(line_num)
+                data['par_num'].append(par_num)
+            
+            self._api.Clear()
+        
+        return text, data
+    
+    def _set_api_image(self, pil_image: Image.Image):
+        """将图像像素直接交给引擎，灰度和RGB图像跳过PIL的编码中转"""
+        bytes_per_pixel = {'L': 1, 'RGB': 3}.get(pil_image.mode)
+        if bytes_per_pixel is None:
+            self._api.SetImage(pil_image)
+            return
+        
+        width, height = pil_image.size
+        self._api.SetImageBytes(pil_image.tobytes(), width, height,
+                                bytes_per_pixel, width * bytes_per_pixel)
+    
+    @staticmethod
+    def _parse_config(config: str) -> Tuple[int, Dict[str, str]]:
+        """将命令行风格的配置解析为页面分割模式和引擎变量"""
+        psm = PSM.SINGLE_BLOCK
+        variables = {}
+        
+        tokens = config.split()
+        for i, token in enumerate(tokens):
+            if token == '--psm' and i + 1 < len(tokens):
+                psm = int(tokens[i + 1])
+            elif token == '-c' and i + 1 < len(tokens) and '=' in tokens[i + 1]:
+                name, value = tokens[i + 1].split('=', 1)
+                variables[name] = value
+        
+        return psm, variables
+    
+    def _process_input_image(self, image: Union[np.ndarray, str, Image.Image]) -> Optional[Image.Image]:
+        """处理输入图像，已经是PIL图像（如预处理变体的输出）时原样返回"""
         try:
+            if isinstance(image, Image.Image):
+                return image
             if isinstance(image, str):
                 # 处理base64编码的图像
-                if image.startswith('data:image'):
-                    image = image.split(',')[1]
-                
-                img_data = base64.b64decode(image)
-                pil_image = Image.open(io.BytesIO(img_data))
+                pil_image = self._decode_base64_image(image)
             else:
                 # numpy数组格式的图像
                 if len(image.shape) == 3:
@@ -145,41 +290,54 @@ class TesseractOCRService:
             logger.error(f"图像处理失败: {str(e)}")
             return None
     
-    def _get_default_config(self) -> str:
-        """获取默认的Tesseract配置"""
-        # 优化代码识别的配置参数
-        return r'--oem 3 --psm 6 -c tessedit_char_whitelist=0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ!"#$%&\'()*+,-./:;<=>?@[\\]^_`{|}~'
-    
-    def _get_code_config(self) -> str:
-        """获取专门用于代码识别的配置"""
-        # PSM 6: 统一的文本块
-        # OEM 3: 默认，基于LSTM OCR引擎
-        return r'--oem 3 --psm 6'
-    
     def _process_detailed_results(self, data: Dict) -> List[Dict]:
         """处理详细识别结果"""
-        results = []
+        # 按列整体转换和过滤，避免逐元素调用int()/float()
+        conf = np.asarray(data['conf'], dtype=np.float64)
+        texts = [str(text).strip() for text in data['text']]
+        # 过滤置信度为0的结果和空文本
+        keep = np.flatnonzero((np.trunc(conf) > 0) & np.fromiter(map(bool, texts), dtype=bool, count=len(texts)))
         
-        n_boxes = len(data['text'])
-        for i in range(n_boxes):
-            if int(data['conf'][i]) > 0:  # 过滤置信度为0的结果
-                text = data['text'][i].strip()
-                if text:  # 过滤空文本
-                    results.append({
-                        'text': text,
-                        'confidence': float(data['conf'][i]) / 100.0,  # 转换为0-1范围
-                        'bbox': (
-                            int(data['left'][i]),
-                            int(data['top'][i]),
-                            int(data['width'][i]),
-                            int(data['height'][i])
-                        ),
-                        'word_num': int(data['word_num'][i]),
-                        'line_num': int(data['line_num'][i]),
-                        'par_num': int(data['par_num'][i])
-                    })
+        if keep.size == 0:
+            return []
         
-        return results
+        columns = {
+            key: np.asarray(data[key], dtype=np.int64)[keep].tolist()
+            for key in ('left', 'top', 'width', 'height', 'word_num', 'line_num', 'par_num')
+        }
+        confidences = (conf[keep] / 100.0).tolist()  # 转换为0-1范围
+        
+        return [
+            {
+                'text': texts[i],
+                'confidence': confidence,
+                'bbox': bbox,
+                'word_num': word_num,
+                'line_num': line_num,
+                'par_num': par_num
+            }
+            for i, confidence, bbox, word_num, line_num, par_num in zip(
+                keep.tolist(),
+                confidences,
+                zip(columns['left'], columns['top'], columns['width'], columns['height']),
+                columns['word_num'],
+                columns['line_num'],
+                columns['par_num']
+            )
+        ]
+    
+    def _decode_base64_image(self, image: str) -> Image.Image:
+        """解码base64图像，大图分块解码以限制内存峰值"""
+        start = image.index(',') + 1 if image.startswith('data:image') else 0
+        
+        # 小图或带换行的base64（分块会破坏4字符对齐）直接整体解码
+        if len(image) - start < _STREAM_DECODE_THRESHOLD or '\n' in image:
+            return Image.open(io.BytesIO(base64.b64decode(image[start:])))
+        
+        parser = ImageFile.Parser()
+        for pos in range(start, len(image), _B64_CHUNK_SIZE):
+            parser.feed(binascii.a2b_base64(image[pos:pos + _B64_CHUNK_SIZE]))
+        return parser.close()
     
     def _calculate_confidence_stats(self, results: List[Dict]) -> Dict:
         """计算置信度统计"""
@@ -221,11 +379,8 @@ class TesseractOCRService:
                     'lines': []
                 }
             
-            # 使用代码专用配置
-            config = self._get_code_config()
-            
-            # 执行识别
-            ocr_result = self.recognize_text(processed_image, config)
+            # 执行识别，使用代码专用配置
+            ocr_result = self.recognize_text(processed_image, _CODE_OCR_CFG)
             
             if not ocr_result['success']:
                 return ocr_result
@@ -269,26 +424,29 @@ class TesseractOCRService:
                 return None
             
             # 转换为numpy数组进行处理
-            img_array = np.array(pil_image)
+            img_array = np.asarray(pil_image)
             
             if len(img_array.shape) == 3:
                 # 转换为灰度图
-                gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
+                gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY,
+                                    dst=self._get_scratch('gray', img_array.shape[:2], np.uint8))
             else:
                 gray = img_array
             
             # 1. 自适应阈值处理
             binary = cv2.adaptiveThreshold(
-                gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2
+                gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2,
+                dst=self._get_scratch('binary', gray.shape, np.uint8)
             )
             
             # 2. 形态学操作去除噪声
             kernel = np.ones((1, 1), np.uint8)
-            cleaned = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
+            cleaned = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel,
+                                       dst=self._get_scratch('cleaned', gray.shape, np.uint8))
             
-            # 3. 反色处理（如果背景是暗色）
-            if np.mean(cleaned) < 127:
-                cleaned = cv2.bitwise_not(cleaned)
+            # 3. 反色处理（如果背景是暗色），二值图每16x16取一个像素即可判断背景明暗
+            if cleaned[::16, ::16].mean() < 127:
+                cv2.bitwise_not(cleaned, dst=cleaned)
             
             # 4. 放大图像提高识别精度
             height, width = cleaned.shape
@@ -296,6 +454,9 @@ class TesseractOCRService:
                 scale_factor = 2
                 cleaned = cv2.resize(cleaned, (width * scale_factor, height * scale_factor), 
                                    interpolation=cv2.INTER_CUBIC)
+            else:
+                # 中间缓冲区会被后续调用覆盖，返回前需拷贝
+                cleaned = cleaned.copy()
             
             # 转换回PIL Image
             enhanced_pil = Image.fromarray(cleaned, mode='L')
@@ -306,6 +467,24 @@ class TesseractOCRService:
             logger.error(f"图像增强失败: {str(e)}")
             return self._process_input_image(image)
     
+    def _get_scratch(self, name: str, shape: Tuple[int, ...], dtype) -> np.ndarray:
+        """
+        获取当前线程可复用的中间缓冲区
+        
+        缓冲区按需增长并在后续调用间复用，返回的数组会被下一次同名调用覆盖，
+        不能作为结果直接返回给调用方。
+        """
+        size = int(np.prod(shape))
+        buffers = getattr(self._scratch, 'buffers', None)
+        if buffers is None:
+            buffers = self._scratch.buffers = {}
+        
+        buffer = buffers.get(name)
+        if buffer is None or buffer.dtype != dtype or buffer.size < size:
+            buffer = buffers[name] = np.empty(size, dtype=dtype)
+        
+        return buffer[:size].reshape(shape)
+    
     def _format_as_code_text(self, ocr_result: Dict) -> Dict:
         """将OCR结果格式化为代码文本"""
         detailed_results = ocr_result.get('detailed_results', [])
@@ -313,38 +492,38 @@ class TesseractOCRService:
         if not detailed_results:
             return {'code_text': '', 'lines': []}
         
-        # 按行分组
-        lines_dict = {}
-        for result in detailed_results:
-            line_num = result['line_num']
-            if line_num not in lines_dict:
-                lines_dict[line_num] = []
-            lines_dict[line_num].append(result)
+        # 按行号、x坐标一次排序，再在行号变化处切分，每组内已按x坐标有序
+        count = len(detailed_results)
+        line_nums = np.fromiter((r['line_num'] for r in detailed_results), dtype=np.int64, count=count)
+        lefts = np.fromiter((r['bbox'][0] for r in detailed_results), dtype=np.int64, count=count)
+        confidences = np.fromiter((r['confidence'] for r in detailed_results), dtype=np.float64, count=count)
+        
+        order = np.lexsort((lefts, line_nums))
+        split_idx = np.flatnonzero(np.diff(line_nums[order])) + 1
         
         # 处理每一行
         formatted_lines = []
-        for line_num in sorted(lines_dict.keys()):
-            line_results = sorted(lines_dict[line_num], key=lambda x: x['bbox'][0])  # 按x坐标排序
+        for group in np.split(order, split_idx):
+            line_results = [detailed_results[i] for i in group]
             
             # 重构行文本
             line_text = self._reconstruct_line_text(line_results)
             
             # 估算缩进
-            first_word = line_results[0] if line_results else None
-            indent_level = self._estimate_indent_level(first_word['bbox'][0]) if first_word else 0
+            indent_level = self._estimate_indent_level(int(lefts[group[0]]))
             
             formatted_line = {
-                'line_number': line_num,
+                'line_number': int(line_nums[group[0]]),
                 'text': line_text,
                 'indent_level': indent_level,
                 'formatted_text': '    ' * indent_level + line_text,  # 4空格缩进
-                'confidence': np.mean([r['confidence'] for r in line_results])
+                'confidence': confidences[group].mean()
             }
             
             formatted_lines.append(formatted_line)
         
         # 生成最终代码文本
-        code_text = '\\n'.join(line['formatted_text'] for line in formatted_lines)
+        code_text = '\n'.join(line['formatted_text'] for line in formatted_lines)
         
         return {
             'code_text': code_text,
@@ -356,29 +535,24 @@ class TesseractOCRService:
         if not line_results:
             return ""
         
-        # 按x坐标排序
-        sorted_results = sorted(line_results, key=lambda x: x['bbox'][0])
+        # 调用方已按x坐标排好序，一次性算出相邻单词的像素间距
+        lefts = np.fromiter((r['bbox'][0] for r in line_results), dtype=np.int64, count=len(line_results))
+        widths = np.fromiter((r['bbox'][2] for r in line_results), dtype=np.int64, count=len(line_results))
+        gaps = lefts[1:] - (lefts[:-1] + widths[:-1])
         
-        # 检测单词间距，插入适当的空格
-        reconstructed = []
-        for i, result in enumerate(sorted_results):
-            if i == 0:
-                reconstructed.append(result['text'])
-            else:
-                prev_result = sorted_results[i-1]
-                prev_right = prev_result['bbox'][0] + prev_result['bbox'][2]
-                curr_left = result['bbox'][0]
-                
-                gap = curr_left - prev_right
-                
-                # 根据间距判断是否需要添加空格
-                if gap > 10:  # 像素间距阈值
-                    num_spaces = max(1, gap // 15)  # 估算空格数量
-                    reconstructed.append(' ' * min(num_spaces, 4))  # 限制最多4个空格
-                
-                reconstructed.append(result['text'])
+        # 间距超过10像素时按每15像素一个空格估算，至少1个、最多4个
+        num_spaces = np.where(gaps > 10, np.clip(gaps // 15, 1, 4), 0)
         
-        return ''.join(reconstructed)
+        reconstructed = [line_results[0]['text']]
+        for spaces, result in zip(num_spaces.tolist(), line_results[1:]):
+            reconstructed.append(' ' * spaces)
+            reconstructed.append(result['text'])
+        
+        line_text = ''.join(reconstructed)
+        for pattern, replacement in _OCR_FIXES:
+            line_text = pattern.sub(replacement, line_text)
+        
+        return line_text
     
     def _estimate_indent_level(self, x_position: int) -> int:
         """估算缩进级别"""
@@ -402,9 +576,10 @@ class TesseractOCRService:
                 'error': 'Tesseract OCR未正确初始化'
             }
         
+        # 代码专用增强是 recognize_code_text 的默认处理，放在最前面，达到提前结束阈值时可省掉其余变体
         preprocessing_variants = [
-            ('original', lambda img: img),
             ('enhanced', lambda img: self._enhance_for_code_recognition(img)),
+            ('original', lambda img: img),
             ('binary', lambda img: self._apply_binary_threshold(img)),
             ('contrast', lambda img: self._enhance_contrast(img))
         ]
@@ -429,6 +604,11 @@ class TesseractOCRService:
                         best_confidence = avg_confidence
                         best_result = result
                         best_result['best_preprocessing'] = variant_name
+                    
+                    # 置信度已足够高，跳过剩余的预处理方式
+                    if avg_confidence >= EARLY_EXIT_CONFIDENCE:
+                        logger.info(f"预处理方式 {variant_name} 置信度 {avg_confidence:.2f}，提前结束")
+                        break
                 
             except Exception as e:
                 logger.warning(f"预处理方式 {variant_name} 失败: {str(e)}")
@@ -449,7 +629,7 @@ class TesseractOCRService:
             if pil_image is None:
                 return None
             
-            img_array = np.array(pil_image.convert('L'))
+            img_array = np.asarray(pil_image.convert('L'))
             
             # 使用OTSU阈值
             _, binary = cv2.threshold(img_array, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
@@ -468,11 +648,20 @@ class TesseractOCRService:
                 return None
             
             # 转换为数组
-            img_array = np.array(pil_image.convert('L'))
+            img_array = np.asarray(pil_image.convert('L'))
+            
+            # 对比度拉伸：由直方图累计分布取2%和98%分位点，避免对整幅图像排序
+            hist = cv2.calcHist([img_array], [0], None, [256], [0, 256]).ravel()
+            cdf = np.cumsum(hist)
+            min_val = int(np.searchsorted(cdf, 0.02 * cdf[-1]))
+            max_val = int(np.searchsorted(cdf, 0.98 * cdf[-1]))
+            if max_val <= min_val:
+                return pil_image.convert('L')
             
-            # 对比度拉伸
-            min_val, max_val = np.percentile(img_array, [2, 98])
-            enhanced = np.clip((img_array - min_val) / (max_val - min_val) * 255, 0, 255).astype(np.uint8)
+            # uint8只有256种取值，用查找表一次完成线性拉伸和截断
+            lut = np.clip((np.arange(256, dtype=np.float32) - min_val) * (255.0 / (max_val - min_val)),
+                          0, 255).astype(np.uint8)
+            enhanced = cv2.LUT(img_array, lut)
             
             return Image.fromarray(enhanced, mode='L')
             
@@ -480,8 +669,20 @@ class TesseractOCRService:
             logger.error(f"对比度增强失败: {str(e)}")
             return None
     
-    def batch_recognize_regions(self, regions: List[Dict]) -> List[Dict]:
-        """批量识别多个区域的文本"""
+    def batch_recognize_regions(self, regions: List[Dict], max_workers: Optional[int] = None) -> List[Dict]:
+        """
+        批量识别多个区域的文本
+        
+        Args:
+            regions: 区域列表，每个区域需包含image_base64
+            max_workers: 并行识别的进程数，为空或1时在当前进程内串行识别
+            
+        Returns:
+            各区域的识别结果
+        """
+        if max_workers and max_workers > 1 and self.is_initialized:
+            return self._batch_recognize_parallel(regions, max_workers)
+        
         results = []
         
         for i, region in enumerate(regions):
@@ -506,6 +707,97 @@ class TesseractOCRService:
         
         return results
     
+    def _batch_recognize_parallel(self, regions: List[Dict], max_workers: int) -> List[Dict]:
+        """
+        在进程池中并行识别多个区域
+        
+        每个区域只在主进程解码一次，像素放入共享内存，子进程仅接收共享内存句柄，
+        避免在进程间重复传输和解码图像数据。
+        """
+        results = []
+        segments = []
+        
+        try:
+            for i, region in enumerate(regions):
+                if 'image_base64' not in region:
+                    logger.warning(f"区域 {i} 缺少图像数据")
+                    continue
+                
+                array = self._decode_to_array(region['image_base64'])
+                if array is None:
+                    results.append({
+                        'region_index': i,
+                        'region_type': region.get('region_type', 'unknown'),
+                        'ocr_result': {'success': False, 'error': '图像处理失败'}
+                    })
+                    continue
+                
+                shm = shared_memory.SharedMemory(create=True, size=array.nbytes)
+                np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[:] = array
+                segments.append((i, region, shm, array.shape, array.dtype.str))
+            
+            if segments:
+                logger.info(f"Tesseract OCR使用 {max_workers} 个进程并行识别 {len(segments)} 个区域")
+                with ProcessPoolExecutor(max_workers=max_workers,
+                                         initializer=_init_worker_service,
+                                         initargs=(self.tesseract_cmd, self.lang)) as executor:
+                    futures = [
+                        executor.submit(_recognize_shared_region, shm.name, shape, dtype)
+                        for _, _, shm, shape, dtype in segments
+                    ]
+                    
+                    for (i, region, _, _, _), future in zip(segments, futures):
+                        try:
+                            ocr_result = future.result()
+                        except Exception as e:
+                            logger.error(f"区域 {i} 并行识别失败: {str(e)}")
+                            ocr_result = {'success': False, 'error': str(e)}
+                        
+                        results.append({
+                            'region_index': i,
+                            'region_type': region.get('region_type', 'unknown'),
+                            'ocr_result': ocr_result
+                        })
+        finally:
+            for _, _, shm, _, _ in segments:
+                shm.close()
+                shm.unlink()
+        
+        results.sort(key=lambda r: r['region_index'])
+        return results
+    
+    def _decode_to_array(self, image: str) -> Optional[np.ndarray]:
+        """将base64图像解码为与numpy输入约定一致的数组（彩色为BGR，灰度为二维）"""
+        pil_image = self._process_input_image(image)
+        if pil_image is None:
+            return None
+        
+        if pil_image.mode == 'L':
+            return np.asarray(pil_image)
+        return cv2.cvtColor(np.asarray(pil_image.convert('RGB')), cv2.COLOR_RGB2BGR)
+    
     def is_available(self) -> bool:
         """检查Tesseract OCR是否可用"""
-        return TESSERACT_AVAILABLE and self.is_initialized
\ No newline at end of file
+        return TESSERACT_AVAILABLE and self.is_initialized
+
+
+# 进程池子进程内的OCR服务实例，由initializer创建，每个子进程只初始化一次
+_worker_service: Optional[TesseractOCRService] = None
+
+
+def _init_worker_service(tesseract_cmd: Optional[str], lang: str):
+    """进程池initializer：在子进程中创建OCR服务"""
+    global _worker_service
+    _worker_service = TesseractOCRService(tesseract_cmd=tesseract_cmd, lang=lang)
+
+
+def _recognize_shared_region(shm_name: str, shape: Tuple[int, ...], dtype: str) -> Dict:
+    """在子进程中挂载共享内存中的图像并识别"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        image = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        result = _worker_service.recognize_with_preprocessing_variants(image)
+        del image
+        return result
+    finally:
+        shm.close()
@@ -4,20 +4,325 @@
 基于代码特征和语法模式识别编程语言。
 """
 
+import copy
+import functools
 import re
-from typing import Dict, List, Optional, Tuple
+import threading
+from types import MappingProxyType
+from typing import Dict, List, NamedTuple, Optional, Tuple
 import keyword
-from collections import Counter
+from collections import Counter, OrderedDict
+
+import numpy as np
+
+try:
+    # Aho-Corasick自动机可在一次线性扫描中找出所有关键字，未安装时退回正则交替
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+try:
+    # RE2保证线性时间匹配，避免回溯型正则在大段OCR文本上的性能退化
+    import re2
+    RE2_AVAILABLE = True
+except ImportError:
+    RE2_AVAILABLE = False
+
+try:
+    # Numba将逐字符统计编译为机器码，一次遍历得到所有字符级特征
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
 
 from app.utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+
+# re对str默认按Unicode解释\w、\d、\s，RE2中这些简写只匹配ASCII，改写为等价的Unicode字符类
+_RE2_CLASS_ESCAPES = {
+    'w': r'\p{L}\p{N}_',
+    'd': r'\p{Nd}',
+    's': r'\t-\r\x1c-\x20\x85\xa0\x{1680}\x{2000}-\x{200a}\x{2028}\x{2029}\x{202f}\x{205f}\x{3000}',
+}
+
+
+def _to_re2_pattern(pattern: str) -> Optional[str]:
+    r"""
+    把re模式改写为RE2下语义相同的模式
+    
+    \w、\d、\s及其大写形式换成显式Unicode字符类；\b、\B在RE2中是ASCII单词边界且无法用
+    字符类表达，字符类内的\W、\D、\S也无法展开，这两种情况返回None，由调用方改用re。
+    """
+    chars = []
+    in_class = False
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\' and i + 1 < len(pattern):
+            escaped = pattern[i + 1]
+            if escaped in 'bB':
+                return None
+            body = _RE2_CLASS_ESCAPES.get(escaped.lower())
+            if body is None:
+                chars.append(pattern[i:i + 2])
+            elif in_class:
+                if escaped.isupper():
+                    return None
+                chars.append(body)
+            else:
+                chars.append(f'[^{body}]' if escaped.isupper() else f'[{body}]')
+            i += 2
+            continue
+        
+        if not in_class and char == '[':
+            in_class = True
+            chars.append(char)
+            i += 1
+            # 紧跟在[或[^后的]是字面量
+            if pattern.startswith('^', i):
+                chars.append('^')
+                i += 1
+            if pattern.startswith(']', i):
+                chars.append('\\]')
+                i += 1
+            continue
+        if in_class and char == ']':
+            in_class = False
+        chars.append(char)
+        i += 1
+    return ''.join(chars)
+
+
+def _compile(pattern: str, flags: int = 0):
+    """
+    编译正则表达式，优先使用RE2
+    
+    模式经_to_re2_pattern改写为Unicode字符类、标志位转为内联形式后交给RE2，匹配结果与re相同；
+    含单词边界等无法等价改写的模式，以及RE2不支持的语法，使用标准库re。
+    """
+    if RE2_AVAILABLE:
+        re2_pattern = _to_re2_pattern(pattern)
+        if re2_pattern is not None:
+            inline = ''.join(char for flag, char in ((re.IGNORECASE, 'i'), (re.MULTILINE, 'm')) if flags & flag)
+            try:
+                return re2.compile(f'(?{inline}){re2_pattern}' if inline else re2_pattern)
+            except Exception:
+                pass
+    return re.compile(pattern, flags)
+
+
+_REGEX_METACHARS = frozenset('.^$*+?{}[]()|\\')
+_QUANTIFIERS = frozenset('*?{')
+
+
+def _literal_prefix(pattern: str) -> Tuple[str, bool]:
+    """
+    提取正则开头必须出现的字面子串
+    
+    Returns:
+        (字面前缀, 整个模式是否就是该字面量)；无法确定前缀时返回空串
+    """
+    if '|' in pattern:
+        return '', False
+    
+    chars = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\' and i + 1 < len(pattern):
+            escaped = pattern[i + 1]
+            if escaped == 'b' and not chars:
+                # 开头的\b是零宽断言，不影响其后的字面量
+                i += 2
+                continue
+            if escaped.isalnum():
+                break
+            chars.append(escaped)
+            i += 2
+        elif char in _REGEX_METACHARS:
+            break
+        else:
+            chars.append(char)
+            i += 1
+        # 后跟*、?、{时最后一个字符可以不出现，不能计入前缀
+        if i < len(pattern) and pattern[i] in _QUANTIFIERS:
+            chars.pop()
+            break
+    return ''.join(chars), i == len(pattern)
+
+
+def _lower_pattern(pattern: str) -> str:
+    r"""把正则中的字面字符转为小写，反斜杠转义（如\S、\W）保持原样，用于匹配预先小写的文本"""
+    chars = []
+    i = 0
+    while i < len(pattern):
+        if pattern[i] == '\\' and i + 1 < len(pattern):
+            chars.append(pattern[i:i + 2])
+            i += 2
+        else:
+            chars.append(pattern[i].lower())
+            i += 1
+    return ''.join(chars)
+
+
+# 与语言无关的行级特征，模块加载时编译一次
+_INDENTED_LINE_RE = _compile(r'^[ \t\r\f\v]{2,}\S', re.MULTILINE)
+_SEMICOLON_LINE_RE = _compile(r';[ \t\r\f\v]*$', re.MULTILINE)
+_COMMENT_RES = [_compile(p) for p in (r'//.*', r'#.*', r'/\*[^*]*\*/', r'<!--[^-]*-->')]
+_STRING_RES = [_compile(p) for p in (r'"[^"]*"', r"'[^']*'", r'`[^`]*`')]
+
+_SYNTAX_CHARS = ('(', ')', '{', '}', '[', ']', ';', '=', '+', '-', '*', '/', '<', '>')
+
+
+# detect_language结果缓存的最大条目数
+_DETECTION_CACHE_SIZE = 1024
+
+# 扩展名已给出提示时，用于直接确认该语言的高区分度特征；命中即跳过全量评分
+_SHIBBOLETHS = {
+    'python': _compile(r'^[ \t]*(?:def[ \t]+\w+[ \t]*\(|import[ \t]+\w|from[ \t]+[\w.]+[ \t]+import\b)', re.MULTILINE),
+    'javascript': _compile(r'\bconsole\.log[ \t]*\(|=>|\b(?:const|let)[ \t]+\w+[ \t]*=|\bfunction\b[^(\n]*\('),
+    'java': _compile(r'\bpublic[ \t]+(?:final[ \t]+|abstract[ \t]+)?class[ \t]|\bSystem\.out\.print|^[ \t]*package[ \t]+[\w.]+;', re.MULTILINE),
+    'cpp': _compile(r'^[ \t]*#include[ \t]*[<"]|\bstd::|\busing[ \t]+namespace\b', re.MULTILINE),
+    'csharp': _compile(r'^[ \t]*using[ \t]+System\b|\bConsole\.Write|^[ \t]*namespace[ \t]+[\w.]+', re.MULTILINE),
+    'html': _compile(r'<!DOCTYPE[ \t]+html|<html\b|</(?:div|body|head|p|span)>', re.IGNORECASE),
+    'css': _compile(r'^[ \t]*[\w.#:\[\]=\-\s,>*]+\{[^}]*\b[\w-]+[ \t]*:[^;{}]+;', re.MULTILINE),
+    'sql': _compile(r'\bSELECT\b[\s\S]+?\bFROM\b|\bINSERT[ \t]+INTO\b|\bCREATE[ \t]+TABLE\b|\bUPDATE\b[\s\S]+?\bSET\b', re.IGNORECASE),
+}
+
+# 命中扩展名与特征双重确认时返回的置信度
+_SHIBBOLETH_CONFIDENCE = 0.95
+
+# 评分特征列：前四列为各语言自己的命中数，后四列为与语言无关的字符级特征
+_SCORE_FEATURES = ('keywords', 'built_ins', 'patterns', 'strings',
+                   'indentation', 'semicolon', 'braces', 'angles')
+
+
+class _CodeFeatures(NamedTuple):
+    """与语言无关的字符级特征计数"""
+    braces: int
+    angles: int
+    semicolon_lines: int
+    indented_lines: int
+    syntax_chars: int
+
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True)
+    def _scan_code_bytes(data):
+        """单次遍历UTF-8字节，统计括号、分号结尾行、缩进行和语法字符"""
+        braces = 0
+        angles = 0
+        semicolon_lines = 0
+        indented_lines = 0
+        syntax_chars = 0
+        at_line_start = True
+        leading_spaces = 0
+        last_visible = 0
+        
+        for i in range(data.shape[0]):
+            c = data[i]
+            if c == 10:  # '\n'
+                if last_visible == 59:  # ';'
+                    semicolon_lines += 1
+                at_line_start = True
+                leading_spaces = 0
+                last_visible = 0
+                continue
+            
+            is_space = c == 32 or c == 9 or c == 13 or c == 11 or c == 12
+            if at_line_start:
+                if is_space:
+                    leading_spaces += 1
+                else:
+                    if leading_spaces >= 2:
+                        indented_lines += 1
+                    at_line_start = False
+            if not is_space:
+                last_visible = c
+            
+            if c == 123 or c == 125:  # '{' '}'
+                braces += 1
+                syntax_chars += 1
+            elif c == 60 or c == 62:  # '<' '>'
+                angles += 1
+                syntax_chars += 1
+            elif (c == 40 or c == 41 or c == 91 or c == 93 or c == 59
+                  or c == 61 or c == 43 or c == 45 or c == 42 or c == 47):  # ()[];=+-*/
+                syntax_chars += 1
+        
+        if last_visible == 59:
+            semicolon_lines += 1
+        
+        return braces, angles, semicolon_lines, indented_lines, syntax_chars
+
+
+def _count_code_features(text: str) -> _CodeFeatures:
+    """统计字符级特征，安装了Numba时走单次遍历的编译路径"""
+    if NUMBA_AVAILABLE:
+        data = np.frombuffer(text.encode('utf-8', 'ignore'), dtype=np.uint8)
+        return _CodeFeatures(*_scan_code_bytes(data))
+    
+    return _CodeFeatures(
+        braces=text.count('{') + text.count('}'),
+        angles=text.count('<') + text.count('>'),
+        semicolon_lines=len(_SEMICOLON_LINE_RE.findall(text)),
+        indented_lines=len(_INDENTED_LINE_RE.findall(text)),
+        syntax_chars=sum(text.count(char) for char in _SYNTAX_CHARS),
+    )
+
+def _freeze(value):
+    """递归地把dict转为只读的MappingProxyType、list转为tuple"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+@functools.lru_cache(maxsize=None)
+def _build_shared_tables() -> MappingProxyType:
+    """
+    构建所有检测器实例共享的签名和预编译表
+    
+    编译正则、构建自动机的开销在进程内只付一次，之后新建LanguageDetector只是复制属性引用。
+    """
+    builder = LanguageDetector.__new__(LanguageDetector)
+    builder._build_tables()
+    return MappingProxyType(dict(vars(builder)))
+
+
 class LanguageDetector:
+    # 判定语言只扫描代码开头的这么多字符，几KB内的命中已足以区分语言；检测详情仍基于全文
+    MAX_SCAN_CHARS = 16384
+    
     def __init__(self):
         """初始化语言检测器"""
-        self.language_signatures = self._load_language_signatures()
+        # 签名与预编译表在进程内只构建一次，所有实例共享同一份只读数据
+        self.__dict__.update(_build_shared_tables())
+        # 视频逐帧识别时同一段代码会被反复检测，按(代码, 文件名)缓存检测结果
+        self._detection_cache: OrderedDict = OrderedDict()
+        self._detection_cache_lock = threading.Lock()
+        self._extension_cache: Dict[str, Optional[str]] = {}
+    
+    def _build_tables(self):
+        """构建签名及其派生的预编译结构，由_build_shared_tables调用一次"""
+        self.language_signatures = _freeze(self._load_language_signatures())
         self.extension_mapping = self._load_extension_mapping()
+        # 扩展名的反向字符trie，支持.d.ts这类多级扩展名的最长后缀匹配
+        self._ext_trie = self._build_extension_trie(self.extension_mapping)
+        # 预编译所有正则，检测热路径上不再重复解析模式字符串
+        self.compiled_signatures = self._compile_language_signatures()
+        # 按语言下标排列的列式评分数据，打分时只做数组运算而不再逐层查签名字典
+        self._langs = tuple(self.language_signatures.keys())
+        self._lang_ids = {lang: i for i, lang in enumerate(self._langs)}
+        self._compiled_by_id = [self.compiled_signatures[lang] for lang in self._langs]
+        self._weight_matrix = self._build_weight_matrix()
+        self._shared_patterns = self._build_shared_patterns()
+        self._all_keywords = sorted({k for info in self.language_signatures.values() for k in info.get('keywords', [])})
+        self._all_keywords_regex = self._compile_word_regex([k.lower() for k in self._all_keywords])
         
     def _load_language_signatures(self) -> Dict:
         """加载各编程语言的特征签名"""
@@ -35,12 +340,12 @@ class LanguageDetector:
                     'input', 'open', 'max', 'min', 'sum', 'all', 'any', 'enumerate', 'zip'
                 ],
                 'patterns': [
-                    r'def\\s+\\w+\\s*\\([^)]*\\)\\s*:',  # 函数定义
-                    r'class\\s+\\w+\\s*(?:\\([^)]*\\))?\\s*:',  # 类定义
-                    r'if\\s+__name__\\s*==\\s*["\']__main__["\']\\s*:',  # main检查
-                    r'\\bself\\b',  # self关键字
-                    r'@\\w+',  # 装饰器
-                    r'\\bprint\\s*\\(',  # print函数
+                    r'def\s+\w+\s*\([^)]*\)\s*:',  # 函数定义
+                    r'class\s+\w+\s*(?:\([^)]*\))?\s*:',  # 类定义
+                    r'if\s+__name__\s*==\s*["\']__main__["\']\s*:',  # main检查
+                    r'\bself\b',  # self关键字
+                    r'@\w+',  # 装饰器
+                    r'\bprint\s*\(',  # print函数
                     r'#.*',  # Python注释
                 ],
                 'string_patterns': [
@@ -71,14 +376,14 @@ class LanguageDetector:
                     'JSON', 'parseInt', 'parseFloat', 'isNaN', 'setTimeout', 'setInterval'
                 ],
                 'patterns': [
-                    r'function\\s+\\w+\\s*\\([^)]*\\)\\s*\\{',  # 函数定义
-                    r'\\w+\\s*=>\\s*',  # 箭头函数
-                    r'\\bvar\\s+\\w+',  # var声明
-                    r'\\b(?:let|const)\\s+\\w+',  # let/const声明
-                    r'console\\.log\\s*\\(',  # console.log
+                    r'function\s+\w+\s*\([^)]*\)\s*\{',  # 函数定义
+                    r'\w+\s*=>\s*',  # 箭头函数
+                    r'\bvar\s+\w+',  # var声明
+                    r'\b(?:let|const)\s+\w+',  # let/const声明
+                    r'console\.log\s*\(',  # console.log
                     r'//.*',  # 单行注释
-                    r'/\\*[^*]*\\*/',  # 多行注释
-                    r'\\$\\{[^}]*\\}',  # 模板字符串
+                    r'/\*[^*]*\*/',  # 多行注释
+                    r'\$\{[^}]*\}',  # 模板字符串
                 ],
                 'string_patterns': [
                     r'`[^`]*`',  # 模板字符串
@@ -108,13 +413,13 @@ class LanguageDetector:
                     'short', 'Short', 'long', 'Long', 'Object', 'System', 'out', 'println'
                 ],
                 'patterns': [
-                    r'public\\s+class\\s+\\w+',  # public class
-                    r'public\\s+static\\s+void\\s+main',  # main方法
-                    r'System\\.out\\.println\\s*\\(',  # System.out.println
-                    r'@\\w+',  # 注解
+                    r'public\s+class\s+\w+',  # public class
+                    r'public\s+static\s+void\s+main',  # main方法
+                    r'System\.out\.println\s*\(',  # System.out.println
+                    r'@\w+',  # 注解
                     r'//.*',  # 单行注释
-                    r'/\\*[^*]*\\*/',  # 多行注释
-                    r'\\bimport\\s+[\\w.]+;',  # import语句
+                    r'/\*[^*]*\*/',  # 多行注释
+                    r'\bimport\s+[\w.]+;',  # import语句
                 ],
                 'string_patterns': [
                     r'"[^"]*"',  # 双引号字符串
@@ -143,14 +448,14 @@ class LanguageDetector:
                     'iostream', 'fstream', 'sstream', 'algorithm', 'iterator'
                 ],
                 'patterns': [
-                    r'#include\\s*<[^>]+>',  # include标准库
-                    r'#include\\s*"[^"]+"',  # include自定义头文件
-                    r'std::\\w+',  # std命名空间
-                    r'cout\\s*<<',  # cout输出
-                    r'cin\\s*>>',  # cin输入
+                    r'#include\s*<[^>]+>',  # include标准库
+                    r'#include\s*"[^"]+"',  # include自定义头文件
+                    r'std::\w+',  # std命名空间
+                    r'cout\s*<<',  # cout输出
+                    r'cin\s*>>',  # cin输入
                     r'//.*',  # 单行注释
-                    r'/\\*[^*]*\\*/',  # 多行注释
-                    r'\\busing\\s+namespace\\s+std\\s*;',  # using namespace
+                    r'/\*[^*]*\*/',  # 多行注释
+                    r'\busing\s+namespace\s+std\s*;',  # using namespace
                 ],
                 'string_patterns': [
                     r'"[^"]*"',  # 双引号字符串
@@ -180,12 +485,12 @@ class LanguageDetector:
                     'bool', 'char', 'DateTime', 'List', 'Dictionary', 'Array'
                 ],
                 'patterns': [
-                    r'using\\s+[\\w.]+;',  # using语句
-                    r'namespace\\s+\\w+',  # namespace声明
-                    r'Console\\.WriteLine\\s*\\(',  # Console.WriteLine
+                    r'using\s+[\w.]+;',  # using语句
+                    r'namespace\s+\w+',  # namespace声明
+                    r'Console\.WriteLine\s*\(',  # Console.WriteLine
                     r'//.*',  # 单行注释
-                    r'/\\*[^*]*\\*/',  # 多行注释
-                    r'\\[\\w+\\]',  # 属性
+                    r'/\*[^*]*\*/',  # 多行注释
+                    r'\[\w+\]',  # 属性
                 ],
                 'string_patterns': [
                     r'@"[^"]*"',  # 逐字字符串
@@ -211,10 +516,10 @@ class LanguageDetector:
                     'body', 'html', 'meta', 'title', 'link'
                 ],
                 'patterns': [
-                    r'<!DOCTYPE\\s+html>',  # DOCTYPE声明
-                    r'<\\w+[^>]*>',  # 开始标签
-                    r'</\\w+>',  # 结束标签
-                    r'<\\w+[^>]*/>',  # 自闭合标签
+                    r'<!DOCTYPE\s+html>',  # DOCTYPE声明
+                    r'<\w+[^>]*>',  # 开始标签
+                    r'</\w+>',  # 结束标签
+                    r'<\w+[^>]*/>',  # 自闭合标签
                     r'<!--[^-]*-->',  # HTML注释
                 ],
                 'string_patterns': [
@@ -237,16 +542,16 @@ class LanguageDetector:
                     'bottom', 'float', 'clear', 'text-align', 'font-size', 'font-weight'
                 ],
                 'patterns': [
-                    r'\\w+\\s*\\{[^}]*\\}',  # CSS规则
-                    r'#\\w+',  # ID选择器
-                    r'\\.\\w+',  # 类选择器
-                    r'/\\*[^*]*\\*/',  # CSS注释
-                    r'\\w+:\\s*[^;]+;',  # 属性声明
+                    r'\w+\s*\{[^}]*\}',  # CSS规则
+                    r'#\w+',  # ID选择器
+                    r'\.\w+',  # 类选择器
+                    r'/\*[^*]*\*/',  # CSS注释
+                    r'\w+:\s*[^;]+;',  # 属性声明
                 ],
                 'string_patterns': [
                     r'"[^"]*"',  # 双引号字符串
                     r"'[^']*'",  # 单引号字符串
-                    r'url\\([^)]+\\)',  # URL函数
+                    r'url\([^)]+\)',  # URL函数
                 ],
                 'brackets': ['{}'],
                 'file_extensions': ['.css', '.scss', '.sass', '.less'],
@@ -268,11 +573,11 @@ class LanguageDetector:
                     'TIMESTAMP', 'BOOLEAN', 'DECIMAL', 'FLOAT', 'DOUBLE'
                 ],
                 'patterns': [
-                    r'SELECT\\s+.*\\s+FROM\\s+\\w+',  # SELECT语句
-                    r'INSERT\\s+INTO\\s+\\w+',  # INSERT语句
-                    r'UPDATE\\s+\\w+\\s+SET',  # UPDATE语句
-                    r'DELETE\\s+FROM\\s+\\w+',  # DELETE语句
-                    r'CREATE\\s+TABLE\\s+\\w+',  # CREATE TABLE
+                    r'SELECT\s+.*\s+FROM\s+\w+',  # SELECT语句
+                    r'INSERT\s+INTO\s+\w+',  # INSERT语句
+                    r'UPDATE\s+\w+\s+SET',  # UPDATE语句
+                    r'DELETE\s+FROM\s+\w+',  # DELETE语句
+                    r'CREATE\s+TABLE\s+\w+',  # CREATE TABLE
                     r'--.*',  # SQL注释
                 ],
                 'string_patterns': [
@@ -296,6 +601,178 @@ class LanguageDetector:
                 extension_map[ext] = lang
         return extension_map
     
+    @staticmethod
+    def _build_extension_trie(extension_mapping: Dict[str, str]) -> Dict:
+        """按扩展名的逆序字符构建嵌套字典trie，终止节点以'_lang'记录语言"""
+        trie: Dict = {}
+        for ext, lang in extension_mapping.items():
+            node = trie
+            for char in reversed(ext.lower()):
+                node = node.setdefault(char, {})
+            node['_lang'] = lang
+        return trie
+    
+    def _compile_language_signatures(self) -> Dict:
+        """预编译各语言签名中的关键字、内置函数和语法模式"""
+        compiled = {}
+        for lang, signature in self.language_signatures.items():
+            keywords = signature.get('keywords', [])
+            built_ins = signature.get('built_ins', [])
+            compiled[lang] = {
+                'keywords_lower': [k.lower() for k in keywords],
+                # 小写后可能重名（如Java的Double与double），记录每个单词在列表中的出现次数
+                'keyword_counts': Counter(k.lower() for k in keywords),
+                'keyword_regex': self._compile_word_regex([k.lower() for k in keywords]),
+                'builtins_lower': [b.lower() for b in built_ins],
+                'builtin_counts': Counter(b.lower() for b in built_ins),
+                'builtin_regex': self._compile_word_regex([b.lower() for b in built_ins]),
+                'automaton': self._build_word_automaton(keywords, built_ins),
+                # 语法模式不区分大小写：评分时用小写模式匹配小写文本，省去逐字符的大小写折叠；
+                # 检测详情需要返回原文中的匹配，仍保留IGNORECASE版本
+                'patterns': self._compile_patterns(lang, signature.get('patterns', []), re.IGNORECASE),
+                'patterns_lower': self._compile_patterns(lang, signature.get('patterns', []), lower=True),
+                'string_patterns': self._compile_patterns(lang, signature.get('string_patterns', [])),
+            }
+        return compiled
+    
+    @staticmethod
+    def _build_word_automaton(keywords: List[str], built_ins: List[str]):
+        """构建关键字和内置函数（小写）的Aho-Corasick自动机，未安装pyahocorasick时返回None"""
+        if not AHOCORASICK_AVAILABLE or not (keywords or built_ins):
+            return None
+        
+        automaton = ahocorasick.Automaton()
+        words = {}
+        for kind, items in (('keyword', keywords), ('builtin', built_ins)):
+            for item in items:
+                word = item.lower()
+                words.setdefault(word, set()).add(kind)
+        for word, kinds in words.items():
+            automaton.add_word(word, (word, frozenset(kinds)))
+        automaton.make_automaton()
+        return automaton
+    
+    @staticmethod
+    def _find_words(compiled: Dict, code_lower: str) -> Tuple[set, set]:
+        """找出小写代码中作为完整单词出现的关键字和内置函数"""
+        automaton = compiled['automaton']
+        if automaton is None:
+            keyword_regex = compiled['keyword_regex']
+            builtin_regex = compiled['builtin_regex']
+            return (set(keyword_regex.findall(code_lower)) if keyword_regex else set(),
+                    set(builtin_regex.findall(code_lower)) if builtin_regex else set())
+        
+        found_keywords, found_builtins = set(), set()
+        text_length = len(code_lower)
+        for end, (word, kinds) in automaton.iter(code_lower):
+            # 自动机按子串命中，需检查两侧字符以保持\b词边界语义
+            start = end - len(word) + 1
+            if start > 0 and (code_lower[start - 1].isalnum() or code_lower[start - 1] == '_'):
+                continue
+            if end + 1 < text_length and (code_lower[end + 1].isalnum() or code_lower[end + 1] == '_'):
+                continue
+            if 'keyword' in kinds:
+                found_keywords.add(word)
+            if 'builtin' in kinds:
+                found_builtins.add(word)
+        return found_keywords, found_builtins
+    
+    @staticmethod
+    def _compile_patterns(lang: str, patterns: List[str], flags: int = 0,
+                          lower: bool = False) -> List[Tuple[str, re.Pattern]]:
+        """编译语法模式，lower为True时编译小写化的模式；无法编译的模式记录警告后跳过，不影响其余模式"""
+        compiled = []
+        for pattern in patterns:
+            # 签名模式写成原始字符串，连续两个反斜杠会让正则匹配字面反斜杠而非\s、\w等转义
+            assert '\\\\' not in pattern, f"语言 {lang} 的模式 {pattern!r} 含有多余的反斜杠转义"
+            try:
+                compiled.append((pattern, _compile(_lower_pattern(pattern) if lower else pattern, flags)))
+            except re.error as e:
+                logger.warning(f"语言 {lang} 的模式 {pattern!r} 编译失败，已跳过: {str(e)}")
+        return compiled
+    
+    def _build_weight_matrix(self) -> np.ndarray:
+        """
+        把各语言的权重倍数展开为(语言数, 特征数)的矩阵，列顺序见_SCORE_FEATURES
+        
+        语言不具备的特征（如非缩进语言的缩进、不要求分号的语言的分号）权重为0。
+        """
+        weights = np.zeros((len(self._langs), len(_SCORE_FEATURES)))
+        for i, lang in enumerate(self._langs):
+            signature = self.language_signatures[lang]
+            multipliers = signature.get('weight_multipliers', {})
+            brackets = signature.get('brackets', [])
+            weights[i] = (
+                multipliers.get('keywords', 1.0),
+                multipliers.get('built_ins', 1.0),
+                multipliers.get('patterns', 1.0),
+                multipliers.get('strings', 0.5),
+                multipliers.get('indentation', 1.0) if signature.get('indentation') == 'spaces' else 0.0,
+                multipliers.get('semicolon', 1.0) if signature.get('semicolon_required') else 0.0,
+                0.5 * brackets.count('{}'),
+                0.3 * brackets.count('<>'),
+            )
+        return weights
+    
+    def _build_shared_patterns(self) -> List[Tuple[re.Pattern, str, bool, bool, np.ndarray, np.ndarray]]:
+        """
+        合并各语言中相同的语法/字符串模式
+        
+        注释、字符串等模式在多种语言间大量重复，合并后每个不同的正则在一次检测中只扫描一遍，
+        再把匹配数分摊给引用它的语言。
+        
+        Returns:
+            [(编译后的正则, 字面前缀, 是否匹配小写文本, 是否纯字面量, 语言下标数组, 类别下标数组)]，
+            类别下标0为语法模式，1为字符串模式
+        """
+        shared = {}
+        for lang_id, compiled in enumerate(self._compiled_by_id):
+            # 语法模式匹配小写文本而字符串模式区分大小写，同一文本在两类中是不同的正则
+            for text, pattern in compiled['patterns_lower']:
+                shared.setdefault((text, True), (pattern, []))[1].append((lang_id, 0))
+            for text, pattern in compiled['string_patterns']:
+                shared.setdefault((text, False), (pattern, []))[1].append((lang_id, 1))
+        
+        entries = []
+        for (text, on_lower), (pattern, owners) in shared.items():
+            prefix, is_literal = _literal_prefix(text)
+            entries.append((pattern, prefix.lower() if on_lower else prefix, on_lower, is_literal,
+                            np.array([o[0] for o in owners], dtype=np.intp),
+                            np.array([o[1] for o in owners], dtype=np.intp)))
+        return entries
+    
+    def _count_shared_patterns(self, code_text: str, code_lower: str) -> np.ndarray:
+        """
+        对每个不同的模式扫描一次，返回形状为(语言数, 2)的[语法模式匹配数, 字符串模式匹配数]
+        
+        模式开头的字面前缀先用C实现的str.count/in检查：纯字面量直接计数，前缀不出现则跳过正则。
+        
+        不把各模式合并成一个命名分组的交替正则（词法分析器式的单遍扫描）：交替匹配互相消耗文本，
+        例如注释里的self、规则块内的属性声明只会被计一次，分数会系统性偏低。
+        """
+        counts = np.zeros((len(self._langs), 2))
+        for pattern, prefix, on_lower, is_literal, lang_ids, categories in self._shared_patterns:
+            haystack = code_lower if on_lower else code_text
+            if is_literal:
+                matches = haystack.count(prefix)
+            elif prefix and prefix not in haystack:
+                continue
+            else:
+                matches = len(pattern.findall(haystack))
+            if matches:
+                # 同一语言可能重复引用同一模式，用add.at保证每次引用都累加
+                np.add.at(counts, (lang_ids, categories), matches)
+        return counts
+    
+    @staticmethod
+    def _compile_word_regex(words: List[str], flags: int = 0) -> Optional[re.Pattern]:
+        """将一组单词编译为带词边界的单个交替正则，一次扫描即可找出所有出现的单词"""
+        if not words:
+            return None
+        # 长词优先，避免交替分支被较短的前缀抢先匹配
+        alternatives = sorted({re.escape(w) for w in words}, key=len, reverse=True)
+        return _compile(r'\b(' + '|'.join(alternatives) + r')\b', flags)
+    
     def detect_language(self, code_text: str, filename: Optional[str] = None) -> Dict:
         """
         检测代码的编程语言
@@ -307,58 +784,29 @@ class LanguageDetector:
         Returns:
             检测结果字典
         """
+        key = (code_text, filename)
+        with self._detection_cache_lock:
+            cached = self._detection_cache.get(key)
+            if cached is not None:
+                self._detection_cache.move_to_end(key)
+                # 结果里有嵌套的details/all_scores，深拷贝后调用方修改不会影响缓存
+                return copy.deepcopy(cached)
+        
+        result = self._detect_impl(code_text, filename)
+        
+        # 只缓存成功的结果，异常情况下次仍重新检测
+        if result['success']:
+            with self._detection_cache_lock:
+                self._detection_cache[key] = result
+                if len(self._detection_cache) > _DETECTION_CACHE_SIZE:
+                    self._detection_cache.popitem(last=False)
+        
+        return copy.deepcopy(result)
+    
+    def _detect_impl(self, code_text: str, filename: Optional[str] = None) -> Dict:
+        """执行语言检测，不经过结果缓存"""
         try:
-            if not code_text.strip():
-                return {
-                    'success': False,
-                    'error': '代码文本为空',
-                    'detected_language': None
-                }
-            
-            # 1. 基于文件扩展名的初步判断
-            extension_hint = None
-            if filename:
-                extension_hint = self._detect_by_extension(filename)
-            
-            # 2. 基于代码内容的检测
-            language_scores = {}
-            
-            for lang, signature in self.language_signatures.items():
-                score = self._calculate_language_score(code_text, signature)
-                if score > 0:
-                    language_scores[lang] = score
-            
-            # 3. 如果有扩展名提示，给对应语言加分
-            if extension_hint and extension_hint in language_scores:
-                language_scores[extension_hint] *= 1.5
-            
-            # 4. 排序并选择最佳匹配
-            if language_scores:
-                sorted_languages = sorted(language_scores.items(), key=lambda x: x[1], reverse=True)
-                best_language = sorted_languages[0][0]
-                best_score = sorted_languages[0][1]
-                
-                # 计算置信度
-                confidence = min(1.0, best_score / 10.0)  # 归一化到0-1
-                
-                return {
-                    'success': True,
-                    'detected_language': best_language,
-                    'confidence': confidence,
-                    'all_scores': dict(language_scores),
-                    'extension_hint': extension_hint,
-                    'details': self._get_detection_details(code_text, best_language)
-                }
-            else:
-                return {
-                    'success': True,
-                    'detected_language': 'unknown',
-                    'confidence': 0.0,
-                    'all_scores': {},
-                    'extension_hint': extension_hint,
-                    'details': {}
-                }
-                
+            result = self._detect_core(code_text, filename)
         except Exception as e:
             logger.error(f"语言检测失败: {str(e)}")
             return {
@@ -366,85 +814,150 @@ class LanguageDetector:
                 'error': str(e),
                 'detected_language': None
             }
+        
+        if result is None:
+            return {
+                'success': False,
+                'error': '代码文本为空',
+                'detected_language': None
+            }
+        return result
+    
+    def _detect_core(self, code_text: str, filename: Optional[str] = None) -> Optional[Dict]:
+        """
+        检测核心逻辑，不做异常处理，由调用方统一捕获
+        
+        Returns:
+            检测结果字典；代码文本为空时返回None
+        """
+        if not code_text.strip():
+            return None
+        
+        # 1. 基于文件扩展名的初步判断
+        extension_hint = None
+        if filename:
+            extension_hint = self._detect_by_extension(filename)
+        
+        # 扩展名与高区分度特征同时指向一种语言时直接返回，不必为所有语言评分
+        shibboleth = _SHIBBOLETHS.get(extension_hint)
+        if shibboleth is not None and shibboleth.search(code_text, 0, self.MAX_SCAN_CHARS):
+            return {
+                'success': True,
+                'detected_language': extension_hint,
+                'confidence': _SHIBBOLETH_CONFIDENCE,
+                'all_scores': {},
+                'extension_hint': extension_hint,
+                'details': self._get_detection_details(code_text, extension_hint)
+            }
+        
+        # 2. 基于代码内容的检测
+        scores = self._score_languages(self._language_hits(code_text))
+        
+        return self._build_detection_result(code_text, scores, extension_hint)
+    
+    def _build_detection_result(self, code_text: str, scores: np.ndarray, extension_hint: Optional[str]) -> Dict:
+        """根据各语言分数和扩展名提示组装检测结果"""
+        language_scores = {lang: score for lang, score in zip(self._langs, scores.tolist()) if score > 0}
+        
+        # 3. 如果有扩展名提示，给对应语言加分
+        if extension_hint and extension_hint in language_scores:
+            language_scores[extension_hint] *= 1.5
+        
+        # 4. 排序并选择最佳匹配
+        if language_scores:
+            sorted_languages = sorted(language_scores.items(), key=lambda x: x[1], reverse=True)
+            best_language = sorted_languages[0][0]
+            best_score = sorted_languages[0][1]
+            
+            # 计算置信度
+            confidence = min(1.0, best_score / 10.0)  # 归一化到0-1
+            
+            return {
+                'success': True,
+                'detected_language': best_language,
+                'confidence': confidence,
+                'all_scores': dict(language_scores),
+                'extension_hint': extension_hint,
+                'details': self._get_detection_details(code_text, best_language)
+            }
+        else:
+            return {
+                'success': True,
+                'detected_language': 'unknown',
+                'confidence': 0.0,
+                'all_scores': {},
+                'extension_hint': extension_hint,
+                'details': {}
+            }
     
     def _detect_by_extension(self, filename: str) -> Optional[str]:
         """基于文件扩展名检测语言"""
         if not filename:
             return None
         
-        # 提取扩展名
-        parts = filename.lower().split('.')
-        if len(parts) < 2:
-            return None
+        if filename in self._extension_cache:
+            return self._extension_cache[filename]
         
-        extension = '.' + parts[-1]
-        return self.extension_mapping.get(extension)
+        language = self._lookup_extension(filename)
+        if len(self._extension_cache) >= _DETECTION_CACHE_SIZE:
+            self._extension_cache.clear()
+        self._extension_cache[filename] = language
+        return language
     
-    def _calculate_language_score(self, code_text: str, signature: Dict) -> float:
-        """计算语言匹配分数"""
-        score = 0.0
+    def _lookup_extension(self, filename: str) -> Optional[str]:
+        """从文件名末尾逆序遍历扩展名trie，返回最长匹配后缀对应的语言"""
+        node = self._ext_trie
+        last_match = None
+        for char in reversed(filename.lower()):
+            node = node.get(char)
+            if node is None:
+                break
+            if '_lang' in node:
+                last_match = node['_lang']
+        return last_match
+    
+    def _language_hits(self, code_text: str) -> np.ndarray:
+        """
+        统计各语言在每个评分特征上的命中数
+        
+        Args:
+            code_text: 代码文本，只统计前MAX_SCAN_CHARS个字符
+            
+        Returns:
+            形状为(语言数, 特征数)的命中矩阵，行按self._langs排列，列顺序见_SCORE_FEATURES
+        """
+        code_text = code_text[:self.MAX_SCAN_CHARS]
+        hits = np.empty_like(self._weight_matrix)
         code_lower = code_text.lower()
         
-        # 1. 关键字匹配
-        keywords = signature.get('keywords', [])
-        if keywords:
-            keyword_matches = sum(1 for keyword in keywords if re.search(r'\\b' + re.escape(keyword.lower()) + r'\\b', code_lower))
-            keyword_score = keyword_matches * signature.get('weight_multipliers', {}).get('keywords', 1.0)
-            score += keyword_score
+        # 1-2. 关键字、内置函数匹配（统计出现过的不同单词个数）
+        for i, compiled in enumerate(self._compiled_by_id):
+            found_keywords, found_builtins = self._find_words(compiled, code_lower)
+            # 只遍历交替正则实际命中的单词，而不是逐个检查整张关键字表
+            keyword_counts, builtin_counts = compiled['keyword_counts'], compiled['builtin_counts']
+            hits[i, 0] = sum(keyword_counts[keyword] for keyword in found_keywords)
+            hits[i, 1] = sum(builtin_counts[builtin] for builtin in found_builtins)
         
-        # 2. 内置函数/类型匹配
-        built_ins = signature.get('built_ins', [])
-        if built_ins:
-            builtin_matches = sum(1 for builtin in built_ins if re.search(r'\\b' + re.escape(builtin.lower()) + r'\\b', code_lower))
-            builtin_score = builtin_matches * signature.get('weight_multipliers', {}).get('built_ins', 1.0)
-            score += builtin_score
+        # 3-4. 语法模式与字符串模式匹配
+        hits[:, 2:4] = self._count_shared_patterns(code_text, code_lower)
         
-        # 3. 语法模式匹配
-        patterns = signature.get('patterns', [])
-        if patterns:
-            pattern_matches = 0
-            for pattern in patterns:
-                matches = len(re.findall(pattern, code_text, re.IGNORECASE))
-                pattern_matches += matches
-            pattern_score = pattern_matches * signature.get('weight_multipliers', {}).get('patterns', 1.0)
-            score += pattern_score
-        
-        # 4. 字符串模式匹配
-        string_patterns = signature.get('string_patterns', [])
-        if string_patterns:
-            string_matches = 0
-            for pattern in string_patterns:
-                matches = len(re.findall(pattern, code_text))
-                string_matches += matches
-            string_score = string_matches * signature.get('weight_multipliers', {}).get('strings', 0.5)
-            score += string_score
-        
-        # 5. 特定语言特征
-        # 缩进检查（Python特有）
-        if signature.get('indentation') == 'spaces':
-            indented_lines = len(re.findall(r'^\\s{2,}\\S', code_text, re.MULTILINE))
-            if indented_lines > 0:
-                indentation_score = indented_lines * signature.get('weight_multipliers', {}).get('indentation', 1.0)
-                score += indentation_score
-        
-        # 分号检查（C系语言）
-        if signature.get('semicolon_required'):
-            semicolon_lines = len(re.findall(r';\\s*$', code_text, re.MULTILINE))
-            if semicolon_lines > 0:
-                semicolon_score = semicolon_lines * signature.get('weight_multipliers', {}).get('semicolon', 1.0)
-                score += semicolon_score
-        
-        # 括号类型检查
-        brackets = signature.get('brackets', [])
-        for bracket_type in brackets:
-            if bracket_type == '{}':
-                brace_count = code_text.count('{') + code_text.count('}')
-                score += brace_count * 0.5
-            elif bracket_type == '<>':
-                angle_count = code_text.count('<') + code_text.count('>')
-                score += angle_count * 0.3
-        
-        return score
+        # 5. 缩进、分号和括号特征对所有语言相同，由权重矩阵决定各语言是否计入
+        features = _count_code_features(code_text)
+        hits[:, 4:] = (features.indented_lines, features.semicolon_lines, features.braces, features.angles)
+        
+        return hits
+    
+    def _score_languages(self, hits: np.ndarray) -> np.ndarray:
+        """
+        按权重矩阵把命中数折算为分数
+        
+        Args:
+            hits: 单个片段(语言数, 特征数)或一批片段(片段数, 语言数, 特征数)的命中矩阵
+            
+        Returns:
+            去掉特征维后的分数数组
+        """
+        return (hits * self._weight_matrix).sum(axis=-1)
     
     def _get_detection_details(self, code_text: str, language: str) -> Dict:
         """获取检测详情"""
@@ -452,43 +965,41 @@ class LanguageDetector:
             return {}
         
         signature = self.language_signatures[language]
+        compiled = self.compiled_signatures[language]
         details = {}
+        code_lower = code_text.lower()
         
         # 统计关键字出现次数
         keywords = signature.get('keywords', [])
         if keywords:
-            keyword_counts = {}
-            for keyword in keywords:
-                count = len(re.findall(r'\\b' + re.escape(keyword) + r'\\b', code_text, re.IGNORECASE))
-                if count > 0:
-                    keyword_counts[keyword] = count
-            details['keyword_matches'] = keyword_counts
+            details['keyword_matches'] = self._count_words(compiled['keyword_regex'], keywords, code_lower)
         
         # 统计内置函数出现次数
         built_ins = signature.get('built_ins', [])
         if built_ins:
-            builtin_counts = {}
-            for builtin in built_ins:
-                count = len(re.findall(r'\\b' + re.escape(builtin) + r'\\b', code_text, re.IGNORECASE))
-                if count > 0:
-                    builtin_counts[builtin] = count
-            details['builtin_matches'] = builtin_counts
+            details['builtin_matches'] = self._count_words(compiled['builtin_regex'], built_ins, code_lower)
         
         # 统计模式匹配
-        patterns = signature.get('patterns', [])
+        patterns = compiled['patterns']
         if patterns:
             pattern_matches = []
-            for pattern in patterns:
-                matches = re.findall(pattern, code_text, re.IGNORECASE)
+            for pattern_text, pattern in patterns:
+                matches = pattern.findall(code_text)
                 if matches:
                     pattern_matches.append({
-                        'pattern': pattern,
+                        'pattern': pattern_text,
                         'matches': matches[:5]  # 只保留前5个匹配
                     })
             details['pattern_matches'] = pattern_matches
         
         return details
     
+    @staticmethod
+    def _count_words(regex: re.Pattern, words: List[str], text_lower: str) -> Dict[str, int]:
+        """用小写单词的交替正则扫描一次小写文本，统计每个单词（不区分大小写）的出现次数，只保留出现过的单词"""
+        counts = Counter(regex.findall(text_lower))
+        return {word: counts[word.lower()] for word in words if counts[word.lower()] > 0}
+    
     def detect_language_from_multiple_sources(self, 
                                             code_snippets: List[str], 
                                             filenames: List[Optional[str]] = None) -> Dict:
@@ -510,26 +1021,38 @@ class LanguageDetector:
                     'detected_language': None
                 }
             
-            # 确保filenames长度与code_snippets一致
+            # 确保filenames长度与code_snippets一致，补齐时复制一份，不修改调用方传入的列表
             if filenames is None:
                 filenames = [None] * len(code_snippets)
-            elif len(filenames) != len(code_snippets):
-                filenames.extend([None] * (len(code_snippets) - len(filenames)))
-            
-            # 检测每个片段
-            all_results = []
-            language_scores = Counter()
-            
-            for code, filename in zip(code_snippets, filenames):
-                if code and code.strip():
-                    result = self.detect_language(code, filename)
-                    if result['success'] and result['detected_language'] != 'unknown':
-                        all_results.append(result)
-                        
-                        # 累计分数
-                        detected_lang = result['detected_language']
-                        confidence = result['confidence']
-                        language_scores[detected_lang] += confidence
+            elif len(filenames) < len(code_snippets):
+                filenames = list(filenames) + [None] * (len(code_snippets) - len(filenames))
+            
+            # 一次性为所有非空片段统计命中矩阵，批量折算分数
+            valid = [(code, filename) for code, filename in zip(code_snippets, filenames) if code and code.strip()]
+            if valid:
+                raw_scores = self._score_languages(np.stack([self._language_hits(code) for code, _ in valid]))
+            else:
+                raw_scores = np.zeros((0, len(self._langs)))
+            
+            # 扩展名提示对应语言的分数乘1.5，与单片段检测一致
+            extension_hints = [self._detect_by_extension(filename) for _, filename in valid]
+            scores = raw_scores.copy()
+            for i, extension_hint in enumerate(extension_hints):
+                if extension_hint in self._lang_ids:
+                    scores[i, self._lang_ids[extension_hint]] *= 1.5
+            
+            best_ids = scores.argmax(axis=1)
+            best_scores = scores[np.arange(len(valid)), best_ids]
+            detected = best_scores > 0
+            confidences = np.minimum(1.0, best_scores / 10.0)
+            
+            # 按识别出的语言累计置信度
+            detected_ids = best_ids[detected]
+            totals = np.bincount(detected_ids, weights=confidences[detected], minlength=len(self._langs))
+            all_results = [
+                self._build_detection_result(code, raw_scores[i], extension_hints[i])
+                for i, (code, _) in enumerate(valid) if detected[i]
+            ]
             
             if not all_results:
                 return {
@@ -541,11 +1064,12 @@ class LanguageDetector:
                 }
             
             # 计算最终结果
-            total_confidence = sum(language_scores.values())
-            language_distribution = {lang: score/total_confidence for lang, score in language_scores.items()}
+            total_confidence = totals.sum()
+            language_distribution = {self._langs[i]: float(totals[i] / total_confidence) for i in np.flatnonzero(totals)}
             
             # 选择最佳语言
-            best_language = language_scores.most_common(1)[0][0]
+            best_id = int(totals.argmax())
+            best_language = self._langs[best_id]
             best_confidence = language_distribution[best_language]
             
             return {
@@ -554,7 +1078,7 @@ class LanguageDetector:
                 'confidence': best_confidence,
                 'language_distribution': language_distribution,
                 'individual_results': all_results,
-                'consensus_strength': len([r for r in all_results if r['detected_language'] == best_language]) / len(all_results)
+                'consensus_strength': float(np.count_nonzero(detected_ids == best_id) / len(detected_ids))
             }
             
         except Exception as e:
@@ -565,13 +1089,13 @@ class LanguageDetector:
                 'detected_language': None
             }
     
-    def get_language_info(self, language: str) -> Optional[Dict]:
-        """获取特定语言的信息"""
+    def get_language_info(self, language: str) -> Optional[MappingProxyType]:
+        """获取特定语言的信息（只读视图）"""
         return self.language_signatures.get(language)
     
-    def get_supported_languages(self) -> List[str]:
+    def get_supported_languages(self) -> Tuple[str, ...]:
         """获取支持的语言列表"""
-        return list(self.language_signatures.keys())
+        return self._langs
     
     def is_code_like(self, text: str) -> Dict:
         """
@@ -591,18 +1115,14 @@ class LanguageDetector:
             confidence_factors = []
             
             # 1. 检查是否包含编程关键字
-            all_keywords = set()
-            for lang_info in self.language_signatures.values():
-                all_keywords.update(lang_info.get('keywords', []))
-            
-            keyword_matches = sum(1 for keyword in all_keywords if re.search(r'\\b' + re.escape(keyword) + r'\\b', text, re.IGNORECASE))
+            found = set(self._all_keywords_regex.findall(text.lower()))
+            keyword_matches = sum(1 for keyword in self._all_keywords if keyword.lower() in found)
             if keyword_matches > 0:
                 code_indicators.append('contains_keywords')
                 confidence_factors.append(min(1.0, keyword_matches / 5.0))
             
             # 2. 检查语法字符
-            syntax_chars = ['(', ')', '{', '}', '[', ']', ';', '=', '+', '-', '*', '/', '<', '>']
-            syntax_char_count = sum(text.count(char) for char in syntax_chars)
+            syntax_char_count = _count_code_features(text).syntax_chars
             syntax_density = syntax_char_count / len(text)
             
             if syntax_density > 0.05:
@@ -610,29 +1130,27 @@ class LanguageDetector:
                 confidence_factors.append(min(1.0, syntax_density * 10))
             
             # 3. 检查缩进模式
-            lines = text.split('\\n')
-            indented_lines = sum(1 for line in lines if line.startswith(('    ', '\\t')))
+            lines = text.split('\n')
+            indented_lines = sum(1 for line in lines if line.startswith(('    ', '\t')))
             if len(lines) > 1 and indented_lines / len(lines) > 0.3:
                 code_indicators.append('has_indentation')
                 confidence_factors.append(0.7)
             
             # 4. 检查注释模式
-            comment_patterns = [r'//.*', r'#.*', r'/\\*[^*]*\\*/', r'<!--[^-]*-->']
-            comment_matches = sum(len(re.findall(pattern, text)) for pattern in comment_patterns)
+            comment_matches = sum(len(pattern.findall(text)) for pattern in _COMMENT_RES)
             if comment_matches > 0:
                 code_indicators.append('contains_comments')
                 confidence_factors.append(0.6)
             
             # 5. 检查字符串模式
-            string_patterns = [r'"[^"]*"', r"'[^']*'", r'`[^`]*`']
-            string_matches = sum(len(re.findall(pattern, text)) for pattern in string_patterns)
+            string_matches = sum(len(pattern.findall(text)) for pattern in _STRING_RES)
             if string_matches > 0:
                 code_indicators.append('contains_strings')
                 confidence_factors.append(0.5)
             
             # 计算总体置信度
             if confidence_factors:
-                overall_confidence = np.mean(confidence_factors)
+                overall_confidence = sum(confidence_factors) / len(confidence_factors)
                 is_code_like = overall_confidence > 0.3
             else:
                 overall_confidence = 0.0
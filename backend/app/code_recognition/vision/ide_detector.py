@@ -4,23 +4,153 @@ IDE检测器
 基于计算机视觉技术检测和识别各种代码编辑器和IDE界面。
 """
 
+import copy
 import cv2
 import numpy as np
 from typing import List, Dict, Tuple, Optional
 import json
+import math
 import os
+import threading
+from collections import OrderedDict
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    # Numba把位置聚类的逐元素循环编译为机器码
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
 
 from app.utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+# 长边超过该值的截图先按整数倍缩小再分析，IDE界面的颜色和布局特征在缩略图上依然完整
+_ANALYSIS_MAX_SIDE = 1024
+
+# IDE匹配分数需超过该值才计入结果
+_MIN_MATCH_CONFIDENCE = 0.3
+
+# detect_ide结果缓存的最大条目数，视频逐帧检测时相邻的相同画面直接复用结果
+_DETECTION_CACHE_SIZE = 8
+
+# 侧边栏的最小宽度（像素），更窄的竖条视为活动栏而非侧边栏
+_SIDEBAR_MIN_WIDTH = 50
+
+# UI元素检测的线程数，与检测项数一致
+_UI_DETECTOR_WORKERS = 5
+
+# 像素数超过该值时，主要颜色统计只取每8个像素中的一个
+_COLOR_SAMPLE_THRESHOLD = 1_000_000
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True)
+    def _cluster_sorted_positions(positions, threshold):
+        """对已排序的位置做一维聚类，相邻间距不超过threshold的归为一簇，返回每簇的整数均值"""
+        clusters = np.empty(positions.shape[0], dtype=np.int64)
+        n_clusters = 0
+        total = positions[0]
+        count = 1
+        for i in range(1, positions.shape[0]):
+            if positions[i] - positions[i - 1] <= threshold:
+                total += positions[i]
+                count += 1
+            else:
+                clusters[n_clusters] = total // count
+                n_clusters += 1
+                total = positions[i]
+                count = 1
+        clusters[n_clusters] = total // count
+        return clusters[:n_clusters + 1]
+else:
+    def _cluster_sorted_positions(positions, threshold):
+        """对已排序的位置做一维聚类，相邻间距不超过threshold的归为一簇，返回每簇的整数均值"""
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(positions) > threshold) + 1))
+        counts = np.diff(np.append(starts, positions.shape[0]))
+        return np.add.reduceat(positions, starts) // counts
+
+
+def _frame_key(image: np.ndarray) -> Optional[Tuple]:
+    """
+    画面的缓存键：图像尺寸加9x8灰度缩略图的差值哈希（dHash）
+    
+    相邻帧只有光标、少量文字变化时哈希不变；非三通道图像返回None，不参与缓存。
+    """
+    if not isinstance(image, np.ndarray) or image.ndim != 3 or image.shape[2] != 3 or image.size == 0:
+        return None
+    thumb = cv2.cvtColor(cv2.resize(image, (9, 8), interpolation=cv2.INTER_AREA), cv2.COLOR_RGB2GRAY)
+    return image.shape, np.packbits(thumb[:, 1:] > thumb[:, :-1]).tobytes()
+
+
+def _to_json_safe(value):
+    """递归地把结果中的ndarray转换为列表、NumPy标量转换为Python标量"""
+    if isinstance(value, dict):
+        return {k: _to_json_safe(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(_to_json_safe(v) for v in value)
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    return value
+
+
+def _channel_mean_std(pixels: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """用cv2.meanStdDev一次得到三通道图像（或(N, 1, 3)像素数组）各通道的均值和标准差"""
+    mean, std = cv2.meanStdDev(pixels)
+    return mean.ravel(), std.ravel()
+
+
+def _pooled_variance(mean: np.ndarray, std: np.ndarray) -> float:
+    """由各通道均值和标准差求所有通道数值合在一起的方差，等价于np.var(pixels.reshape(-1, 3))"""
+    return float(np.mean(std ** 2 + mean ** 2) - np.mean(mean) ** 2)
+
+
+class _ImageProjections:
+    """
+    图像按行、按列投影后的累计通道和
+    
+    UI检测用到的区域都是贯穿整行或整列的条带，一次投影后任意条带的平均色都能O(1)求出，
+    不必为每个条带重新遍历像素。缩小后的图像单通道总和不超过2^31，用int32累加即精确又只占float64一半的内存。
+    """
+    
+    def __init__(self, image: np.ndarray):
+        self.height, self.width = image.shape[:2]
+        self.row_cumsum = np.zeros((self.height + 1, 3), dtype=np.int32)
+        np.cumsum(image.sum(axis=1, dtype=np.int32), axis=0, out=self.row_cumsum[1:])
+        self.col_cumsum = np.zeros((self.width + 1, 3), dtype=np.int32)
+        np.cumsum(image.sum(axis=0, dtype=np.int32), axis=0, out=self.col_cumsum[1:])
+    
+    def rows_mean(self, y1: int, y2: int) -> np.ndarray:
+        """第y1到y2行（不含y2）整行条带的各通道平均值"""
+        return (self.row_cumsum[y2] - self.row_cumsum[y1]) / ((y2 - y1) * self.width)
+    
+    def cols_mean(self, x1: int, x2: int) -> np.ndarray:
+        """第x1到x2列（不含x2）整列条带的各通道平均值"""
+        return (self.col_cumsum[x2] - self.col_cumsum[x1]) / ((x2 - x1) * self.height)
+
+
 class IDEDetector:
     def __init__(self):
         """初始化IDE检测器"""
         self.ide_signatures = self._load_ide_signatures()
         self.color_ranges = self._define_color_ranges()
         self.ui_patterns = self._define_ui_patterns()
+        # 颜色签名的范围预先转换为数组，匹配时不再逐个组件构造
+        self._color_bounds = {
+            ide_name: self._compile_color_bounds(signature.get('signature_colors', {}))
+            for ide_name, signature in self.ide_signatures.items()
+        }
+        # 各IDE在UI元素全部检测到时能得到的UI分数，用于在UI检测前估计分数上限
+        all_detected = {name: {'detected': True} for name in ('sidebar', 'status_bar', 'tabs', 'minimap', 'menu_bar')}
+        self._ui_score_caps = {
+            ide_name: self._match_ui_signature(all_detected, signature.get('distinctive_features', []))
+            for ide_name, signature in self.ide_signatures.items()
+        }
+        # 各UI检测项读取互不重叠的条带，OpenCV/NumPy运算期间释放GIL，可在线程中并行
+        self._pool = ThreadPoolExecutor(max_workers=_UI_DETECTOR_WORKERS, thread_name_prefix='ide-ui')
+        self._detection_cache: OrderedDict = OrderedDict()
+        self._detection_cache_lock = threading.Lock()
         
     def _load_ide_signatures(self) -> Dict:
         """加载IDE特征签名"""
@@ -164,26 +294,83 @@ class IDEDetector:
         Returns:
             检测结果字典
         """
+        key = _frame_key(image)
+        if key is not None:
+            with self._detection_cache_lock:
+                cached = self._detection_cache.get(key)
+                if cached is not None:
+                    self._detection_cache.move_to_end(key)
+                    # 结果里有嵌套的ui_elements/color_analysis，深拷贝后调用方修改不会影响缓存
+                    return copy.deepcopy(cached)
+        
+        result = self._detect_ide_impl(image)
+        
+        # 只缓存成功的结果，异常情况下次仍重新检测
+        if key is not None and result['success']:
+            with self._detection_cache_lock:
+                self._detection_cache[key] = result
+                if len(self._detection_cache) > _DETECTION_CACHE_SIZE:
+                    self._detection_cache.popitem(last=False)
+        
+        return copy.deepcopy(result)
+    
+    def _detect_ide_impl(self, image: np.ndarray) -> Dict:
+        """执行IDE检测，不经过结果缓存"""
         try:
             height, width = image.shape[:2]
             
+            # 高分辨率截图先缩小，后续所有分析都在缩略图上进行
+            scale = max(1, max(height, width) // _ANALYSIS_MAX_SIDE)
+            if scale > 1:
+                image = cv2.resize(image, (width // scale, height // scale), interpolation=cv2.INTER_AREA)
+            
+            # 保证内存连续后展平为像素数组，reshape只是视图，不再复制整幅图像
+            image = np.ascontiguousarray(image)
+            pixels = image.reshape(-1, 3)
+            
+            # 灰度图和行列投影只计算一次，供后续各项分析共用
+            gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+            projections = _ImageProjections(image)
+            
+            # 整幅图的边缘只检测一次，区域和顶部条带的边缘密度都从中切片
+            edges = cv2.Canny(gray, 50, 150)
+            
             # 分析图像的整体特征
-            overall_features = self._analyze_overall_features(image)
+            overall_features = self._analyze_overall_features(image, edges)
+            
+            # 分析颜色特征
+            color_analysis = self._analyze_color_scheme(image, gray, pixels)
+            
+            # 空白或非IDE画面：UI分数取满分也没有IDE能超过阈值，跳过UI元素检测
+            if not self._can_reach_threshold(overall_features, color_analysis):
+                if scale > 1:
+                    self._rescale_geometry(overall_features, {}, scale, (width, height))
+                return _to_json_safe({
+                    'success': True,
+                    'detected_ide': None,
+                    'all_matches': [],
+                    'ui_elements': {},
+                    'color_analysis': color_analysis,
+                    'overall_features': overall_features
+                })
             
             # 检测UI元素
-            ui_elements = self._detect_ui_elements(image)
+            ui_elements = self._detect_ui_elements(image, gray, edges, projections)
             
-            # 分析颜色特征
-            color_analysis = self._analyze_color_scheme(image)
+            # 把检测到的尺寸和区域坐标换算回原图
+            if scale > 1:
+                self._rescale_geometry(overall_features, ui_elements, scale, (width, height))
             
             # 匹配IDE签名
             ide_matches = []
+            ui_score_cache = {}
             for ide_name, signature in self.ide_signatures.items():
                 match_score = self._calculate_ide_match_score(
-                    overall_features, ui_elements, color_analysis, signature
+                    overall_features, ui_elements, color_analysis, signature, self._color_bounds[ide_name],
+                    threshold=_MIN_MATCH_CONFIDENCE, ui_score_cache=ui_score_cache
                 )
                 
-                if match_score > 0.3:  # 最低置信度阈值
+                if match_score > _MIN_MATCH_CONFIDENCE:
                     ide_matches.append({
                         'ide_name': ide_name,
                         'display_name': signature['name'],
@@ -197,14 +384,15 @@ class IDEDetector:
             # 准备结果
             best_match = ide_matches[0] if ide_matches else None
             
-            return {
+            # 分析过程中保留ndarray，只在返回前统一转换为可JSON序列化的Python对象
+            return _to_json_safe({
                 'success': True,
                 'detected_ide': best_match,
                 'all_matches': ide_matches,
                 'ui_elements': ui_elements,
                 'color_analysis': color_analysis,
                 'overall_features': overall_features
-            }
+            })
             
         except Exception as e:
             logger.error(f"IDE检测失败: {str(e)}")
@@ -213,22 +401,16 @@ class IDEDetector:
                 'error': str(e)
             }
     
-    def _analyze_overall_features(self, image: np.ndarray) -> Dict:
+    def _analyze_overall_features(self, image: np.ndarray, edges: np.ndarray) -> Dict:
         """分析图像的整体特征"""
         height, width = image.shape[:2]
         
-        # 转换为灰度图分析结构
-        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-        
-        # 检测边缘
-        edges = cv2.Canny(gray, 50, 150)
-        
         # 查找主要的垂直和水平线条
         vertical_lines = self._detect_lines(edges, 'vertical')
         horizontal_lines = self._detect_lines(edges, 'horizontal')
         
         # 计算区域分割
-        regions = self._identify_main_regions(image, vertical_lines, horizontal_lines)
+        regions = self._identify_main_regions(image, edges, vertical_lines, horizontal_lines)
         
         return {
             'image_size': (width, height),
@@ -238,105 +420,102 @@ class IDEDetector:
             'has_complex_layout': len(vertical_lines) > 2 or len(horizontal_lines) > 2
         }
     
+    @staticmethod
+    def _rescale_geometry(overall_features: Dict, ui_elements: Dict, scale: int, image_size: Tuple[int, int]):
+        """把在缩略图上得到的尺寸、坐标按缩放倍数换算回原图"""
+        overall_features['image_size'] = image_size
+        overall_features['analysis_scale'] = scale
+        for region in overall_features['main_regions']:
+            region['bbox'] = tuple(v * scale for v in region['bbox'])
+        for element in ui_elements.values():
+            for key in ('width', 'height'):
+                if key in element:
+                    element[key] *= scale
+    
     def _detect_lines(self, edges: np.ndarray, direction: str) -> List[int]:
-        """检测主要的线条"""
+        """
+        检测主要的线条
+        
+        只关心贯穿界面的水平/垂直分割线，因此直接对边缘图按列（或按行）求和，
+        边缘像素数达到图像高（或宽）一半的列（行）即视为分割线，代替HoughLinesP的投票。
+        """
         height, width = edges.shape
         
         if direction == 'vertical':
-            # 检测垂直线
-            lines = cv2.HoughLinesP(edges, 1, np.pi/180, threshold=height//3, 
-                                  minLineLength=height//2, maxLineGap=20)
-            
-            if lines is not None:
-                vertical_positions = []
-                for line in lines:
-                    x1, y1, x2, y2 = line[0]
-                    if abs(x1 - x2) < 10:  # 近似垂直线
-                        vertical_positions.append((x1 + x2) // 2)
-                
-                # 聚类相近的位置
-                return self._cluster_positions(vertical_positions, width // 20)
-            
+            # 每列的边缘强度之和
+            projection = cv2.reduce(edges, 0, cv2.REDUCE_SUM, dtype=cv2.CV_32S).ravel()
+            min_line_length, cluster_threshold = height // 2, width // 20
         else:  # horizontal
-            # 检测水平线
-            lines = cv2.HoughLinesP(edges, 1, np.pi/180, threshold=width//3,
-                                  minLineLength=width//2, maxLineGap=20)
-            
-            if lines is not None:
-                horizontal_positions = []
-                for line in lines:
-                    x1, y1, x2, y2 = line[0]
-                    if abs(y1 - y2) < 10:  # 近似水平线
-                        horizontal_positions.append((y1 + y2) // 2)
-                
-                return self._cluster_positions(horizontal_positions, height // 20)
+            # 每行的边缘强度之和
+            projection = cv2.reduce(edges, 1, cv2.REDUCE_SUM, dtype=cv2.CV_32S).ravel()
+            min_line_length, cluster_threshold = width // 2, height // 20
         
-        return []
+        # Canny输出为0/255，边缘像素数达到min_line_length才算一条线
+        positions = np.flatnonzero(projection >= max(min_line_length, 1) * 255)
+        
+        # 聚类相近的位置
+        return self._cluster_positions(positions, cluster_threshold)
     
     def _cluster_positions(self, positions: List[int], threshold: int) -> List[int]:
         """聚类相近的位置"""
-        if not positions:
+        if len(positions) == 0:
             return []
         
-        positions.sort()
-        clusters = []
-        current_cluster = [positions[0]]
-        
-        for pos in positions[1:]:
-            if pos - current_cluster[-1] <= threshold:
-                current_cluster.append(pos)
-            else:
-                clusters.append(int(np.mean(current_cluster)))
-                current_cluster = [pos]
-        
-        clusters.append(int(np.mean(current_cluster)))
-        return clusters
+        sorted_positions = np.sort(np.asarray(positions, dtype=np.int64))
+        return _cluster_sorted_positions(sorted_positions, threshold).tolist()
     
-    def _identify_main_regions(self, image: np.ndarray, vertical_lines: List[int], horizontal_lines: List[int]) -> List[Dict]:
-        """识别主要区域"""
+    def _identify_main_regions(self, image: np.ndarray, edges: np.ndarray,
+                               vertical_lines: List[int], horizontal_lines: List[int]) -> List[Dict]:
+        """
+        识别主要区域
+        
+        分割线把图像划成网格，每个格子的颜色均值、方差和边缘密度都由积分图四个角点相减得到，
+        所有格子一次向量化求出，不再逐格切片统计。
+        """
         height, width = image.shape[:2]
         regions = []
         
         # 添加边界线
-        v_lines = [0] + sorted(vertical_lines) + [width]
-        h_lines = [0] + sorted(horizontal_lines) + [height]
+        v_lines = np.array([0] + sorted(vertical_lines) + [width])
+        h_lines = np.array([0] + sorted(horizontal_lines) + [height])
+        
+        # 三通道的像素和、平方和以及边缘图（0/255）的积分图；和不超过2^31用int32精确累加，平方和仍需float64
+        channel_sum, channel_sqsum = cv2.integral2(image, sdepth=cv2.CV_32S, sqdepth=cv2.CV_64F)
+        edge_sum = cv2.integral(edges, sdepth=cv2.CV_32S)
+        
+        def cell_sums(table: np.ndarray) -> np.ndarray:
+            # 形状为(水平分割数, 垂直分割数[, 通道])，第[j, i]项是第j行第i列格子内的总和
+            corners = table[np.ix_(h_lines, v_lines)]
+            return corners[1:, 1:] - corners[:-1, 1:] - corners[1:, :-1] + corners[:-1, :-1]
+        
+        areas = np.outer(np.diff(h_lines), np.diff(v_lines))
+        safe_areas = np.maximum(areas, 1)
+        avg_colors = cell_sums(channel_sum) / safe_areas[..., None]
+        color_variances = np.maximum(cell_sums(channel_sqsum) / safe_areas[..., None] - avg_colors ** 2, 0)
+        edge_densities = cell_sums(edge_sum) / 255 / safe_areas
         
         # 分析每个区域
         for i in range(len(v_lines) - 1):
             for j in range(len(h_lines) - 1):
-                x1, x2 = v_lines[i], v_lines[i + 1]
-                y1, y2 = h_lines[j], h_lines[j + 1]
-                
-                # 提取区域
-                region = image[y1:y2, x1:x2]
-                
-                if region.size > 0:
-                    region_features = self._analyze_region(region)
+                if areas[j, i] > 0:
+                    x1, x2 = int(v_lines[i]), int(v_lines[i + 1])
+                    y1, y2 = int(h_lines[j]), int(h_lines[j + 1])
                     regions.append({
                         'bbox': (x1, y1, x2 - x1, y2 - y1),
                         'position': self._classify_region_position(x1, y1, x2, y2, width, height),
-                        'features': region_features
+                        'features': self._analyze_region(avg_colors[j, i], color_variances[j, i],
+                                                         float(edge_densities[j, i]))
                     })
         
         return regions
     
-    def _analyze_region(self, region: np.ndarray) -> Dict:
-        """分析单个区域的特征"""
-        # 计算平均颜色
-        avg_color = np.mean(region.reshape(-1, 3), axis=0)
-        
-        # 计算颜色方差（用于判断复杂度）
-        color_variance = np.var(region.reshape(-1, 3), axis=0)
-        
-        # 检测是否包含文本（基于边缘密度）
-        gray_region = cv2.cvtColor(region, cv2.COLOR_RGB2GRAY)
-        edges = cv2.Canny(gray_region, 50, 150)
-        edge_density = np.sum(edges > 0) / edges.size
-        
+    def _analyze_region(self, avg_color: np.ndarray, color_variance: np.ndarray, edge_density: float) -> Dict:
+        """由区域的平均颜色、颜色方差（用于判断复杂度）和边缘密度整理单个区域的特征"""
         return {
-            'avg_color': avg_color.tolist(),
-            'color_variance': color_variance.tolist(),
+            'avg_color': avg_color,
+            'color_variance': color_variance,
             'edge_density': edge_density,
+            # 检测是否包含文本（基于边缘密度）
             'likely_contains_text': edge_density > 0.05,
             'is_uniform': np.mean(color_variance) < 100
         }
@@ -366,61 +545,65 @@ class IDEDetector:
         else:
             return f"{vertical_pos}_{horizontal_pos}"
     
-    def _detect_ui_elements(self, image: np.ndarray) -> Dict:
-        """检测UI元素"""
-        height, width = image.shape[:2]
-        elements = {}
-        
-        # 检测侧边栏
-        elements['sidebar'] = self._detect_sidebar(image)
-        
-        # 检测状态栏
-        elements['status_bar'] = self._detect_status_bar(image)
-        
-        # 检测标签页
-        elements['tabs'] = self._detect_tabs(image)
-        
-        # 检测小地图
-        elements['minimap'] = self._detect_minimap(image)
-        
-        # 检测菜单栏
-        elements['menu_bar'] = self._detect_menu_bar(image)
+    def _detect_ui_elements(self, image: np.ndarray, gray: np.ndarray, edges: np.ndarray,
+                            projections: _ImageProjections) -> Dict:
+        """检测UI元素，五个检测项提交到线程池并行执行"""
+        futures = {
+            # 检测侧边栏
+            'sidebar': self._pool.submit(self._detect_sidebar, image, gray, projections),
+            # 检测状态栏
+            'status_bar': self._pool.submit(self._detect_status_bar, image, projections),
+            # 检测标签页
+            'tabs': self._pool.submit(self._detect_tabs, edges),
+            # 检测小地图
+            'minimap': self._pool.submit(self._detect_minimap, image, gray),
+            # 检测菜单栏
+            'menu_bar': self._pool.submit(self._detect_menu_bar, image, edges),
+        }
         
-        return elements
+        return {name: future.result() for name, future in futures.items()}
     
-    def _detect_sidebar(self, image: np.ndarray) -> Dict:
-        """检测侧边栏"""
+    def _detect_sidebar(self, image: np.ndarray, gray: np.ndarray, projections: _ImageProjections) -> Dict:
+        """
+        检测侧边栏
+        
+        在左侧条带内按列统计水平梯度（Sobel x），梯度峰值所在的列即侧边栏与编辑器的分界，
+        峰值列决定侧边栏宽度，峰值大小作为边界强度。
+        """
         height, width = image.shape[:2]
         
         # 检查左侧区域
-        left_strip_width = min(width // 4, 300)  # 最多检查1/4宽度
-        left_strip = image[:, :left_strip_width]
+        search_limit = min(width // 4, 300)  # 最多检查1/4宽度
+        
+        # 检测垂直分界线：从宽度合理的位置开始找，避免把VS Code等的活动栏边界当成侧边栏
+        if search_limit > _SIDEBAR_MIN_WIDTH + 1 and height > 0:
+            grad_x = cv2.Sobel(gray[:, :search_limit + 1], cv2.CV_16S, 1, 0)
+            profile = cv2.reduce(np.abs(grad_x), 0, cv2.REDUCE_AVG, dtype=cv2.CV_32F).ravel()
+            # 3x3 Sobel对台阶的响应是相邻像素差的4倍，换算回与像素差相同的量纲
+            band = profile[_SIDEBAR_MIN_WIDTH:search_limit] / 4
+            peak = int(np.argmax(band))
+            edge_strength = float(band[peak])
+            # 台阶两侧的两列响应相同，argmax取左列，分界在其右侧
+            left_strip_width = _SIDEBAR_MIN_WIDTH + peak + 1
+        else:
+            left_strip_width = search_limit
+            edge_strength = 0
         
         # 分析左侧区域的特征
-        avg_color = np.mean(left_strip.reshape(-1, 3), axis=0)
-        color_std = np.std(left_strip.reshape(-1, 3), axis=0)
+        avg_color = projections.cols_mean(0, left_strip_width) if left_strip_width > 0 else None
         
         # 检测与主编辑器区域的颜色差异
-        main_area = image[:, left_strip_width:width-left_strip_width//2]
-        if main_area.size > 0:
-            main_avg_color = np.mean(main_area.reshape(-1, 3), axis=0)
-            color_diff = np.linalg.norm(avg_color - main_avg_color)
+        main_right = width - left_strip_width // 2
+        if avg_color is not None and main_right > left_strip_width and height > 0:
+            main_avg_color = projections.cols_mean(left_strip_width, main_right)
+            color_diff = math.dist(avg_color, main_avg_color)
         else:
             color_diff = 0
         
-        # 检测垂直分界线
-        edge_column = left_strip_width - 1
-        if edge_column < width - 1:
-            left_edge = image[:, edge_column]
-            right_edge = image[:, edge_column + 1]
-            edge_strength = np.mean(np.abs(left_edge.astype(float) - right_edge.astype(float)))
-        else:
-            edge_strength = 0
-        
         has_sidebar = (
             color_diff > 30 and  # 颜色有明显差异
             edge_strength > 20 and  # 有明显边界
-            left_strip_width > 50  # 宽度合理
+            left_strip_width > _SIDEBAR_MIN_WIDTH  # 宽度合理
         )
         
         return {
@@ -431,7 +614,7 @@ class IDEDetector:
             'confidence': min(1.0, (color_diff + edge_strength) / 100)
         }
     
-    def _detect_status_bar(self, image: np.ndarray) -> Dict:
+    def _detect_status_bar(self, image: np.ndarray, projections: _ImageProjections) -> Dict:
         """检测状态栏"""
         height, width = image.shape[:2]
         
@@ -443,14 +626,14 @@ class IDEDetector:
             return {'detected': False}
         
         # 分析底部区域特征
-        avg_color = np.mean(bottom_strip.reshape(-1, 3), axis=0)
-        color_variance = np.var(bottom_strip.reshape(-1, 3))
+        avg_color = projections.rows_mean(height - bottom_strip_height, height)
+        color_variance = _pooled_variance(*_channel_mean_std(bottom_strip))
         
         # 检测与上方区域的差异
-        above_area = image[height-bottom_strip_height*3:height-bottom_strip_height, :]
-        if above_area.size > 0:
-            above_avg_color = np.mean(above_area.reshape(-1, 3), axis=0)
-            color_diff = np.linalg.norm(avg_color - above_avg_color)
+        above_top = height - bottom_strip_height * 3
+        if above_top < height - bottom_strip_height:
+            above_avg_color = projections.rows_mean(above_top, height - bottom_strip_height)
+            color_diff = math.dist(avg_color, above_avg_color)
         else:
             color_diff = 0
         
@@ -468,26 +651,22 @@ class IDEDetector:
             'confidence': min(1.0, color_diff / 50)
         }
     
-    def _detect_tabs(self, image: np.ndarray) -> Dict:
+    def _detect_tabs(self, edges: np.ndarray) -> Dict:
         """检测标签页"""
-        height, width = image.shape[:2]
+        height, width = edges.shape[:2]
         
         # 检查顶部区域
         top_strip_height = min(height // 8, 60)
-        top_strip = image[:top_strip_height, :]
         
-        if top_strip.size == 0:
+        if top_strip_height == 0 or width == 0:
             return {'detected': False}
         
         # 检测水平分割（标签页的特征）
-        gray_strip = cv2.cvtColor(top_strip, cv2.COLOR_RGB2GRAY)
-        edges = cv2.Canny(gray_strip, 50, 150)
+        edges = edges[:top_strip_height, :]
         
-        # 查找垂直线（标签分隔符）
-        vertical_lines = []
-        for x in range(width):
-            if np.sum(edges[:, x]) > top_strip_height * 0.3:
-                vertical_lines.append(x)
+        # 查找垂直线（标签分隔符）：按列求和一次得到所有列的边缘强度
+        column_sums = edges.sum(axis=0, dtype=np.int64)
+        vertical_lines = np.flatnonzero(column_sums > top_strip_height * 0.3)
         
         # 聚类相近的线条
         tab_separators = self._cluster_positions(vertical_lines, 20)
@@ -502,7 +681,7 @@ class IDEDetector:
             'confidence': min(1.0, len(tab_separators) / 5)
         }
     
-    def _detect_minimap(self, image: np.ndarray) -> Dict:
+    def _detect_minimap(self, image: np.ndarray, gray: np.ndarray) -> Dict:
         """检测小地图"""
         height, width = image.shape[:2]
         
@@ -514,13 +693,15 @@ class IDEDetector:
             return {'detected': False}
         
         # 小地图的特征：高密度的小元素
-        gray_strip = cv2.cvtColor(right_strip, cv2.COLOR_RGB2GRAY)
+        gray_strip = gray[:, width-right_strip_width:]
         edges = cv2.Canny(gray_strip, 30, 100)
         edge_density = np.sum(edges > 0) / edges.size
         
         # 检测颜色多样性（代码的语法高亮）
-        colors = right_strip.reshape(-1, 3)
-        unique_colors = len(np.unique(colors.view(np.dtype((np.void, colors.dtype.itemsize*colors.shape[1])))))
+        # 把RGB打包成24位整数再去重，一维整数排序远快于按void结构体排序
+        colors = right_strip.reshape(-1, 3).astype(np.uint32)
+        packed = (colors[:, 0] << 16) | (colors[:, 1] << 8) | colors[:, 2]
+        unique_colors = np.unique(packed).size
         color_diversity = unique_colors / (right_strip_width * height)
         
         has_minimap = (
@@ -538,7 +719,7 @@ class IDEDetector:
             'confidence': min(1.0, (edge_density * 5 + color_diversity * 50))
         }
     
-    def _detect_menu_bar(self, image: np.ndarray) -> Dict:
+    def _detect_menu_bar(self, image: np.ndarray, edges: np.ndarray) -> Dict:
         """检测菜单栏"""
         height, width = image.shape[:2]
         
@@ -550,13 +731,11 @@ class IDEDetector:
             return {'detected': False}
         
         # 菜单栏通常颜色比较均匀
-        color_variance = np.var(menu_strip.reshape(-1, 3))
-        avg_brightness = np.mean(cv2.cvtColor(menu_strip, cv2.COLOR_RGB2GRAY))
+        color_variance = _pooled_variance(*_channel_mean_std(menu_strip))
         
         # 检测文本模式（菜单项）
-        gray_strip = cv2.cvtColor(menu_strip, cv2.COLOR_RGB2GRAY)
-        edges = cv2.Canny(gray_strip, 50, 150)
-        text_like_features = np.sum(edges > 0) / edges.size
+        menu_edges = edges[:menu_height, :]
+        text_like_features = np.count_nonzero(menu_edges) / menu_edges.size
         
         has_menu_bar = (
             color_variance < 200 and  # 颜色相对均匀
@@ -571,113 +750,132 @@ class IDEDetector:
             'confidence': min(1.0, text_like_features * 20)
         }
     
-    def _analyze_color_scheme(self, image: np.ndarray) -> Dict:
+    def _analyze_color_scheme(self, image: np.ndarray, gray: np.ndarray, pixels: np.ndarray) -> Dict:
         """分析配色方案"""
         # 计算整体亮度
-        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
         avg_brightness = np.mean(gray)
         
         # 确定主题类型
         theme_type = 'dark' if avg_brightness < 127 else 'light'
         
         # 分析主要颜色
-        pixels = image.reshape(-1, 3)
-        
-        # 使用K-means聚类找出主要颜色
-        from sklearn.cluster import KMeans
-        
-        try:
-            kmeans = KMeans(n_clusters=5, random_state=42, n_init=10)
-            kmeans.fit(pixels[::100])  # 采样以提高性能
-            dominant_colors = kmeans.cluster_centers_.astype(int)
-        except:
-            # 如果scikit-learn不可用，使用简化方法
-            dominant_colors = self._simple_color_analysis(pixels)
+        # 按粗粒度RGB网格统计直方图找出主要颜色，大图隔点采样
+        sample = pixels[::8] if len(pixels) > _COLOR_SAMPLE_THRESHOLD else pixels
+        dominant_colors = self._simple_color_analysis(sample)
         
         return {
             'theme_type': theme_type,
             'avg_brightness': avg_brightness,
-            'dominant_colors': dominant_colors.tolist(),
-            'color_distribution': self._analyze_color_distribution(pixels)
+            'dominant_colors': dominant_colors,
+            'color_distribution': self._analyze_color_distribution(image)
         }
     
-    def _simple_color_analysis(self, pixels: np.ndarray) -> np.ndarray:
-        """简化的颜色分析"""
-        # 将颜色空间分割为网格
-        bins = 8
-        hist, _ = np.histogramdd(pixels, bins=[bins, bins, bins], range=[[0, 256], [0, 256], [0, 256]])
-        
-        # 找出最频繁的颜色
-        top_indices = np.unravel_index(np.argsort(hist.ravel())[-5:], hist.shape)
-        
-        dominant_colors = []
-        for i in range(5):
-            r = top_indices[0][i] * 256 // bins + 128 // bins
-            g = top_indices[1][i] * 256 // bins + 128 // bins  
-            b = top_indices[2][i] * 256 // bins + 128 // bins
-            dominant_colors.append([r, g, b])
+    def _simple_color_analysis(self, pixels: np.ndarray, n_colors: int = 5) -> np.ndarray:
+        """
+        简化的颜色分析
         
-        return np.array(dominant_colors)
+        每个通道量化为16级，把RGB打包成0-4095的整数后用bincount一次统计直方图，
+        取像素最多的n_colors个非空格子中像素的平均色作为主要颜色，按频次从高到低排列。
+        """
+        quantized = (pixels >> 4).astype(np.int32)
+        packed = (quantized[:, 0] << 8) | (quantized[:, 1] << 4) | quantized[:, 2]
+        counts = np.bincount(packed, minlength=4096)
+        
+        top = min(n_colors, int(np.count_nonzero(counts)))
+        if top == 0:
+            return np.empty((0, 3), dtype=int)
+        top_bins = np.argpartition(counts, -top)[-top:]
+        top_bins = top_bins[np.argsort(counts[top_bins])[::-1]]
+        
+        # 格子内像素的平均色比格子中心更接近真实颜色，与签名的颜色范围比较时不会被量化误差推出范围
+        channel_sums = np.stack([np.bincount(packed, weights=pixels[:, c], minlength=4096)[top_bins] for c in range(3)], axis=1)
+        return (channel_sums / counts[top_bins, None]).astype(int)
     
-    def _analyze_color_distribution(self, pixels: np.ndarray) -> Dict:
+    def _analyze_color_distribution(self, image: np.ndarray) -> Dict:
         """分析颜色分布"""
         # 分析RGB通道的分布
-        r_mean, g_mean, b_mean = np.mean(pixels, axis=0)
-        r_std, g_std, b_std = np.std(pixels, axis=0)
+        means, stds = _channel_mean_std(image)
         
         return {
-            'rgb_means': [float(r_mean), float(g_mean), float(b_mean)],
-            'rgb_stds': [float(r_std), float(g_std), float(b_std)],
-            'color_variance': float(np.var(pixels))
+            'rgb_means': means,
+            'rgb_stds': stds,
+            'color_variance': _pooled_variance(means, stds)
         }
     
+    def _can_reach_threshold(self, overall_features: Dict, color_analysis: Dict) -> bool:
+        """UI分数按上限估计时，是否有IDE的匹配分数可能超过最低置信度阈值"""
+        for ide_name, signature in self.ide_signatures.items():
+            score = self._match_color_signature(color_analysis, self._color_bounds[ide_name]) * 0.4
+            score += self._ui_score_caps[ide_name] * 0.4
+            score += self._match_layout_signature(overall_features, signature.get('ui_layout', {})) * 0.2
+            if score > _MIN_MATCH_CONFIDENCE:
+                return True
+        return False
+    
     def _calculate_ide_match_score(self, overall_features: Dict, ui_elements: Dict, 
-                                  color_analysis: Dict, ide_signature: Dict) -> float:
-        """计算IDE匹配分数"""
-        score = 0.0
-        total_weight = 0.0
+                                  color_analysis: Dict, ide_signature: Dict,
+                                  color_bounds: Tuple[np.ndarray, np.ndarray, int],
+                                  threshold: float = 0.0, ui_score_cache: Optional[Dict] = None) -> float:
+        """
+        计算IDE匹配分数
         
+        按颜色、UI元素、布局的顺序累加；剩余各项都取满分也超不过threshold时直接返回0.0，
+        不再计算后面的匹配。ui_score_cache用于在一次检测内复用相同特征列表的UI分数。
+        """
         # 1. 颜色匹配 (权重: 0.4)
-        color_score = self._match_color_signature(color_analysis, ide_signature.get('signature_colors', {}))
-        score += color_score * 0.4
-        total_weight += 0.4
+        color_score = self._match_color_signature(color_analysis, color_bounds)
+        score = color_score * 0.4
+        if score + 0.4 + 0.2 <= threshold:
+            return 0.0
         
         # 2. UI元素匹配 (权重: 0.4)
-        ui_score = self._match_ui_signature(ui_elements, ide_signature.get('distinctive_features', []))
+        distinctive_features = ide_signature.get('distinctive_features', [])
+        cache_key = tuple(distinctive_features)
+        if ui_score_cache is not None and cache_key in ui_score_cache:
+            ui_score = ui_score_cache[cache_key]
+        else:
+            ui_score = self._match_ui_signature(ui_elements, distinctive_features)
+            if ui_score_cache is not None:
+                ui_score_cache[cache_key] = ui_score
         score += ui_score * 0.4
-        total_weight += 0.4
+        if score + 0.2 <= threshold:
+            return 0.0
         
         # 3. 布局匹配 (权重: 0.2)
         layout_score = self._match_layout_signature(overall_features, ide_signature.get('ui_layout', {}))
         score += layout_score * 0.2
-        total_weight += 0.2
         
-        return score / total_weight if total_weight > 0 else 0.0
+        return score
+    
+    @staticmethod
+    def _compile_color_bounds(color_signature: Dict) -> Tuple[np.ndarray, np.ndarray, int]:
+        """
+        把颜色签名中的各组件范围堆叠为数组
+        
+        Returns:
+            (下界数组(C, 3), 上界数组(C, 3), 签名组件总数)
+        """
+        ranges = [color_range for color_range in color_signature.values() if len(color_range) >= 2]
+        mins = np.array([color_range[0] for color_range in ranges], dtype=np.int16).reshape(-1, 3)
+        maxs = np.array([color_range[1] for color_range in ranges], dtype=np.int16).reshape(-1, 3)
+        return mins, maxs, len(color_signature)
     
-    def _match_color_signature(self, color_analysis: Dict, color_signature: Dict) -> float:
+    def _match_color_signature(self, color_analysis: Dict, color_bounds: Tuple[np.ndarray, np.ndarray, int]) -> float:
         """匹配颜色签名"""
-        if not color_signature:
+        mins, maxs, total_signatures = color_bounds
+        if total_signatures == 0:
             return 0.0
         
-        dominant_colors = np.array(color_analysis.get('dominant_colors', []))
+        dominant_colors = np.asarray(color_analysis.get('dominant_colors', []))
         if dominant_colors.size == 0:
             return 0.0
         
-        match_count = 0
-        total_signatures = len(color_signature)
-        
-        for component, color_range in color_signature.items():
-            if len(color_range) >= 2:
-                min_color = np.array(color_range[0])
-                max_color = np.array(color_range[1])
-                
-                # 检查是否有任何主导色在这个范围内
-                for color in dominant_colors:
-                    if np.all(color >= min_color) and np.all(color <= max_color):
-                        match_count += 1
-                        break
+        # 一次广播比较所有(主导色, 组件)组合，组件只要有任一主导色落在范围内即算匹配
+        colors = dominant_colors.reshape(-1, 1, 3)
+        inside = ((colors >= mins) & (colors <= maxs)).all(axis=-1)
+        match_count = int(inside.any(axis=0).sum())
         
-        return match_count / max(total_signatures, 1)
+        return match_count / total_signatures
     
     def _match_ui_signature(self, ui_elements: Dict, distinctive_features: List[str]) -> float:
         """匹配UI特征签名"""
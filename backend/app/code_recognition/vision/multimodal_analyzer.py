@@ -5,23 +5,102 @@
 """
 
 import base64
+import copy
+import hashlib
 import json
-from typing import List, Dict, Optional, Union
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import ClassVar, List, Dict, Optional, Union
+import cv2
 import numpy as np
-from PIL import Image
-import io
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    # orjson解析模型返回的JSON比标准库快数倍，其JSONDecodeError是json.JSONDecodeError的子类
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+from openai import APIConnectionError, APIStatusError, APITimeoutError
 
 from app.gpt.universal_gpt import UniversalGPT
 from app.utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+_json_loads = orjson.loads if ORJSON_AVAILABLE else json.loads
+
+# 批量分析时同时进行的模型调用数，调用耗时主要在等待远端接口
+_DEFAULT_MAX_CONCURRENCY = 8
+
+# 模型调用遇到网络超时、限流或服务端错误时的重试：最多尝试次数和指数退避的初始延迟（秒）
+_MAX_MODEL_ATTEMPTS = 4
+_RETRY_BASE_DELAY = 0.5
+_RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+# 模型分析结果缓存的最大条目数，相同截图和分析类型不再重复调用模型
+_RESULT_CACHE_SIZE = 256
+
+# numpy图像编码结果缓存的最大条目数，同一帧多次参与分析、比较时只编码一次
+_ENCODED_IMAGE_CACHE_SIZE = 32
+
+# 发送给模型的图像长边上限（视觉模型high detail模式会把更大的图缩到该尺寸以内）
+_MAX_IMAGE_EDGE = 1568
+
+# 超过该长度的base64字符串先解码检查尺寸，过大则缩小后重新编码
+_LARGE_BASE64_THRESHOLD = 1_000_000
+
+# 长边不超过该值的图像在低精度（detail=low）模式下也能完整呈现给模型
+_LOW_DETAIL_MAX_EDGE = 512
+
+# 截图编码为JPEG时的质量，代码文字在该质量下依然清晰
+_JPEG_QUALITY = 85
+
 class MultimodalAnalyzer:
-    def __init__(self):
-        """初始化多模态分析器"""
-        self.gpt_service = UniversalGPT()
+    # 未指定模型服务的分析器共用同一个实例，复用其中客户端的连接
+    _shared_gpt_service: ClassVar[Optional[UniversalGPT]] = None
+    _shared_gpt_service_lock: ClassVar[threading.Lock] = threading.Lock()
+    
+    def __init__(self, gpt_service: Optional[UniversalGPT] = None):
+        """
+        初始化多模态分析器
+        
+        Args:
+            gpt_service: 使用的模型服务，为空时使用所有分析器共享的实例
+        """
+        self.gpt_service = gpt_service or self._get_shared_gpt_service()
         self.analysis_prompts = self._load_analysis_prompts()
+        # 比较提示词不含动态内容，初始化时拼好，每次比较直接复用
+        self.comparison_prompt = f"""
+Please compare these two code screenshots and identify the differences between them.
+
+Image 1: First screenshot
+Image 2: Second screenshot
+
+{self.analysis_prompts['code_changes']}
+"""
+        # 消息中的文本部分只随提示词变化，预先构建好，每次调用直接引用
+        self._text_parts = {
+            name: {"type": "text", "text": prompt} for name, prompt in self.analysis_prompts.items()
+        }
+        self._comparison_text_part = {"type": "text", "text": self.comparison_prompt}
+        self._result_cache: OrderedDict = OrderedDict()
+        self._result_cache_lock = threading.Lock()
+        self._encoded_image_cache: OrderedDict = OrderedDict()
+        self._encoded_image_cache_lock = threading.Lock()
         
+    @classmethod
+    def _get_shared_gpt_service(cls) -> UniversalGPT:
+        """获取共享的模型服务，首次调用时创建"""
+        if cls._shared_gpt_service is None:
+            with cls._shared_gpt_service_lock:
+                if cls._shared_gpt_service is None:
+                    cls._shared_gpt_service = UniversalGPT()
+        return cls._shared_gpt_service
+    
     def _load_analysis_prompts(self) -> Dict[str, str]:
         """加载分析提示词"""
         return {
@@ -149,18 +228,22 @@ Provide the response in JSON format:
 """
         }
     
-    def analyze_code_screenshot(self, image: Union[str, np.ndarray], analysis_type: str = 'code_analysis') -> Dict:
+    def analyze_code_screenshot(self, image: Union[str, np.ndarray], analysis_type: str = 'code_analysis',
+                                detail: str = 'auto') -> Dict:
         """
         分析代码截图
         
         Args:
             image: 图像（base64字符串或numpy数组）
             analysis_type: 分析类型 (code_analysis, ide_detection, code_extraction)
+            detail: 图像精度 (auto, low, high)，auto时按分析类型和图像尺寸选择
             
         Returns:
             分析结果
         """
         try:
+            detail = self._resolve_detail(detail, analysis_type, 'high', image)
+            
             # 准备图像
             image_base64 = self._prepare_image_for_analysis(image)
             if not image_base64:
@@ -169,21 +252,26 @@ Provide the response in JSON format:
                     'error': '图像处理失败'
                 }
             
+            cache_key = (self._image_digest(image_base64), analysis_type, detail)
+            cached = self._get_cached_result(cache_key)
+            if cached is not None:
+                return cached
+            
             # 获取对应的提示词
-            prompt = self.analysis_prompts.get(analysis_type, self.analysis_prompts['code_analysis'])
+            text_part = self._text_parts.get(analysis_type, self._text_parts['code_analysis'])
             
             # 调用多模态模型
-            result = self._call_multimodal_model(image_base64, prompt)
+            result = self._call_multimodal_model(image_base64, text_part, detail)
             
             if result['success']:
                 # 解析结果
                 parsed_result = self._parse_analysis_result(result['response'], analysis_type)
-                return {
+                return self._cache_result(cache_key, {
                     'success': True,
                     'analysis_type': analysis_type,
                     'result': parsed_result,
                     'raw_response': result['response']
-                }
+                })
             else:
                 return result
                 
@@ -194,10 +282,39 @@ Provide the response in JSON format:
                 'error': str(e)
             }
     
+    @staticmethod
+    def _image_digest(image_base64: str) -> bytes:
+        """图像数据URI的内容摘要，作为结果缓存键的一部分"""
+        return hashlib.blake2b(image_base64.encode('utf-8'), digest_size=16).digest()
+    
+    def _get_cached_result(self, key: tuple) -> Optional[Dict]:
+        """取出缓存的分析结果，未命中返回None"""
+        with self._result_cache_lock:
+            cached = self._result_cache.get(key)
+            if cached is None:
+                return None
+            self._result_cache.move_to_end(key)
+        # 结果里有嵌套的列表和字典，深拷贝后调用方修改不会影响缓存
+        return copy.deepcopy(cached)
+    
+    def _cache_result(self, key: tuple, result: Dict) -> Dict:
+        """缓存成功的分析结果，返回一份深拷贝给调用方"""
+        with self._result_cache_lock:
+            self._result_cache[key] = result
+            if len(self._result_cache) > _RESULT_CACHE_SIZE:
+                self._result_cache.popitem(last=False)
+        return copy.deepcopy(result)
+    
     def _prepare_image_for_analysis(self, image: Union[str, np.ndarray]) -> Optional[str]:
         """准备用于分析的图像"""
         try:
             if isinstance(image, str):
+                # 体积很大的base64图像解码后按numpy数组的路径缩小并重新编码
+                if len(image) > _LARGE_BASE64_THRESHOLD:
+                    decoded = self._decode_base64_image(image)
+                    if decoded is not None and max(decoded.shape[:2]) > _MAX_IMAGE_EDGE:
+                        return self._prepare_image_for_analysis(decoded)
+                
                 # 已经是base64格式
                 if image.startswith('data:image'):
                     return image
@@ -205,19 +322,22 @@ Provide the response in JSON format:
                     return f"data:image/png;base64,{image}"
             
             elif isinstance(image, np.ndarray):
-                # numpy数组转base64
-                if len(image.shape) == 3:
-                    # RGB图像
-                    pil_image = Image.fromarray(image)
-                else:
-                    # 灰度图像
-                    pil_image = Image.fromarray(image, mode='L')
-                
-                buffer = io.BytesIO()
-                pil_image.save(buffer, format='PNG')
-                img_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
+                # 按像素内容摘要缓存编码结果，原地修改过的数组摘要不同，不会取到旧结果
+                image = np.ascontiguousarray(image)
+                key = (image.shape, image.dtype.str, hashlib.blake2b(memoryview(image), digest_size=16).digest())
+                with self._encoded_image_cache_lock:
+                    cached = self._encoded_image_cache.get(key)
+                    if cached is not None:
+                        self._encoded_image_cache.move_to_end(key)
+                        return cached
                 
-                return f"data:image/png;base64,{img_base64}"
+                encoded = self._encode_array(image)
+                if encoded is not None:
+                    with self._encoded_image_cache_lock:
+                        self._encoded_image_cache[key] = encoded
+                        if len(self._encoded_image_cache) > _ENCODED_IMAGE_CACHE_SIZE:
+                            self._encoded_image_cache.popitem(last=False)
+                return encoded
             
             else:
                 logger.error(f"不支持的图像类型: {type(image)}")
@@ -227,45 +347,91 @@ Provide the response in JSON format:
             logger.error(f"图像准备失败: {str(e)}")
             return None
     
-    def _call_multimodal_model(self, image_base64: str, prompt: str) -> Dict:
-        """调用多模态模型"""
+    def _encode_array(self, image: np.ndarray) -> Optional[str]:
+        """把numpy图像缩小到模型处理尺寸以内并编码为数据URI"""
+        # 超过模型处理尺寸的部分上传了也会被模型缩掉，先在本地缩小
+        height, width = image.shape[:2]
+        scale = _MAX_IMAGE_EDGE / max(height, width)
+        if scale < 1:
+            image = cv2.resize(image, (max(1, int(width * scale)), max(1, int(height * scale))),
+                               interpolation=cv2.INTER_AREA)
+        
+        # numpy数组转base64：带透明通道的图像保留PNG，RGB和灰度图像编码为JPEG，体积更小
+        if image.ndim == 3 and image.shape[2] == 4:
+            ext, mime, params = '.png', 'image/png', []
+            image = cv2.cvtColor(image, cv2.COLOR_RGBA2BGRA)
+        else:
+            ext, mime, params = '.jpg', 'image/jpeg', [cv2.IMWRITE_JPEG_QUALITY, _JPEG_QUALITY]
+            if image.ndim == 3:
+                image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+        
+        ok, encoded = cv2.imencode(ext, image, params)
+        if not ok:
+            logger.error(f"图像编码失败: {ext}")
+            return None
+        img_base64 = base64.b64encode(encoded.tobytes()).decode('utf-8')
+        
+        return f"data:{mime};base64,{img_base64}"
+    
+    @staticmethod
+    def _decode_base64_image(image: str) -> Optional[np.ndarray]:
+        """把base64字符串或数据URI解码为RGB(A)或灰度数组，无法解码时返回None"""
+        payload = image.split(',', 1)[1] if image.startswith('data:image') else image
+        decoded = cv2.imdecode(np.frombuffer(base64.b64decode(payload), dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+        if decoded is None or decoded.ndim == 2:
+            return decoded
+        if decoded.shape[2] == 4:
+            return cv2.cvtColor(decoded, cv2.COLOR_BGRA2RGBA)
+        return cv2.cvtColor(decoded, cv2.COLOR_BGR2RGB)
+    
+    @staticmethod
+    def _resolve_detail(detail: str, analysis_type: str, fallback: str, *images: Union[str, np.ndarray]) -> str:
+        """
+        确定发送图像时的精度
+        
+        显式指定的low/high原样使用；auto时IDE识别只看整体界面用low，所有图像都是长边不超过
+        _LOW_DETAIL_MAX_EDGE的numpy数组时low也不损失信息，其余情况用fallback。
+        """
+        if detail != 'auto':
+            return detail
+        if analysis_type == 'ide_detection':
+            return 'low'
+        if all(isinstance(image, np.ndarray) and max(image.shape[:2]) <= _LOW_DETAIL_MAX_EDGE for image in images):
+            return 'low'
+        return fallback
+    
+    def _call_multimodal_model(self, image_base64: str, text_part: Dict, detail: str = 'auto') -> Dict:
+        """调用多模态模型，text_part为预先构建的提示词消息部分"""
         try:
             # 构建消息
             messages = [
                 {
                     "role": "user",
                     "content": [
-                        {
-                            "type": "text",
-                            "text": prompt
-                        },
+                        text_part,
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": image_base64
+                                "url": image_base64,
+                                "detail": detail
                             }
                         }
                     ]
                 }
             ]
             
-            # 调用GPT服务
-            response = self.gpt_service.call_llm(
-                messages=messages,
-                model_type="gpt-4-vision-preview",  # 使用视觉模型
-                temperature=0.1,  # 低温度保证准确性
-                max_tokens=2000
-            )
+            # 流式调用GPT服务，返回的JSON对象一完整就停止接收
+            content = self._request_model(messages, max_tokens=2000)
             
-            if response.get('success', False):
+            if content.strip():
                 return {
                     'success': True,
-                    'response': response['content']
+                    'response': content
                 }
             else:
                 return {
                     'success': False,
-                    'error': response.get('error', '模型调用失败')
+                    'error': '模型调用失败'
                 }
                 
         except Exception as e:
@@ -275,22 +441,78 @@ Provide the response in JSON format:
                 'error': str(e)
             }
     
+    def _request_model(self, messages: List[Dict], max_tokens: int) -> str:
+        """
+        流式调用视觉模型，返回的JSON对象一完整就停止接收
+        
+        超时、连接错误和可重试的状态码在这里按指数退避加随机抖动重试，
+        已编码的图像留在内存中，不必让上层任务整体重新调度。
+        SDK自带的重试已关闭，单次瞬时故障最多只会发起 _MAX_MODEL_ATTEMPTS 次请求。
+        """
+        for attempt in range(_MAX_MODEL_ATTEMPTS):
+            try:
+                return self._collect_json_response(self.gpt_service.call_llm_stream(
+                    messages=messages,
+                    model_type="gpt-4-vision-preview",  # 使用视觉模型
+                    temperature=0.1,  # 低温度保证准确性
+                    max_tokens=max_tokens,
+                    max_retries=0  # 重试由下面的循环负责，关闭SDK自带的重试
+                ))
+            except (APIConnectionError, APITimeoutError, APIStatusError) as e:
+                status_code = getattr(e, 'status_code', None)
+                retryable = status_code is None or status_code in _RETRYABLE_STATUS_CODES
+                if not retryable or attempt == _MAX_MODEL_ATTEMPTS - 1:
+                    raise
+                
+                delay = _RETRY_BASE_DELAY * (2 ** attempt) + random.uniform(0, _RETRY_BASE_DELAY)
+                logger.warning(f"视觉模型调用失败（第{attempt + 1}次）: {str(e)}，{delay:.2f}秒后重试")
+                time.sleep(delay)
+    
+    @staticmethod
+    def _collect_json_response(chunks) -> str:
+        """
+        拼接流式返回的文本片段
+        
+        跟踪字符串外的花括号深度，第一个顶层JSON对象闭合时关闭响应流并返回，
+        模型在JSON之后追加的说明文字不再等待；没有JSON时返回完整文本。
+        """
+        parts = []
+        depth = 0
+        in_string = escaped = False
+        try:
+            for chunk in chunks:
+                for i, ch in enumerate(chunk):
+                    if in_string:
+                        if escaped:
+                            escaped = False
+                        elif ch == '\\':
+                            escaped = True
+                        elif ch == '"':
+                            in_string = False
+                    elif ch == '"' and depth > 0:
+                        in_string = True
+                    elif ch == '{':
+                        depth += 1
+                    elif ch == '}' and depth > 0:
+                        depth -= 1
+                        if depth == 0:
+                            parts.append(chunk[:i + 1])
+                            return ''.join(parts)
+                parts.append(chunk)
+            return ''.join(parts)
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+    
     def _parse_analysis_result(self, response: str, analysis_type: str) -> Dict:
         """解析分析结果"""
         try:
-            # 尝试解析JSON响应
-            if response.strip().startswith('{') and response.strip().endswith('}'):
-                parsed = json.loads(response)
-                return parsed
-            
-            # 如果不是JSON格式，尝试提取JSON部分
+            # 取第一个'{'到最后一个'}'之间的部分解析，整段就是JSON时即为去掉首尾空白的原文
             json_start = response.find('{')
             json_end = response.rfind('}') + 1
             
             if json_start != -1 and json_end > json_start:
-                json_part = response[json_start:json_end]
-                parsed = json.loads(json_part)
-                return parsed
+                return _json_loads(response[json_start:json_end])
             
             # 如果无法解析为JSON，返回原始文本
             logger.warning(f"无法解析为JSON格式的响应: {analysis_type}")
@@ -307,18 +529,22 @@ Provide the response in JSON format:
                 'parse_error': str(e)
             }
     
-    def compare_code_screenshots(self, image1: Union[str, np.ndarray], image2: Union[str, np.ndarray]) -> Dict:
+    def compare_code_screenshots(self, image1: Union[str, np.ndarray], image2: Union[str, np.ndarray],
+                                 detail: str = 'auto') -> Dict:
         """
         比较两个代码截图的差异
         
         Args:
             image1: 第一个图像
             image2: 第二个图像
+            detail: 图像精度 (auto, low, high)，auto时两张图都足够小才用low，否则high
             
         Returns:
             比较结果
         """
         try:
+            detail = self._resolve_detail(detail, 'code_changes', 'high', image1, image2)
+            
             # 准备图像
             image1_base64 = self._prepare_image_for_analysis(image1)
             image2_base64 = self._prepare_image_for_analysis(image2)
@@ -329,62 +555,49 @@ Provide the response in JSON format:
                     'error': '图像处理失败'
                 }
             
-            # 构建比较提示词
-            comparison_prompt = f\"\"\"
-Please compare these two code screenshots and identify the differences between them.
-
-Image 1: First screenshot
-Image 2: Second screenshot
-
-{self.analysis_prompts['code_changes']}
-\"\"\"
+            cache_key = (self._image_digest(image1_base64), self._image_digest(image2_base64), 'code_changes', detail)
+            cached = self._get_cached_result(cache_key)
+            if cached is not None:
+                return cached
             
             # 构建消息（包含两个图像）
             messages = [
                 {
                     "role": "user",
                     "content": [
-                        {
-                            "type": "text",
-                            "text": comparison_prompt
-                        },
+                        self._comparison_text_part,
                         {
                             "type": "image_url",
                             "image_url": {
                                 "url": image1_base64,
-                                "detail": "high"
+                                "detail": detail
                             }
                         },
                         {
                             "type": "image_url",
                             "image_url": {
                                 "url": image2_base64,
-                                "detail": "high"
+                                "detail": detail
                             }
                         }
                     ]
                 }
             ]
             
-            # 调用GPT服务
-            response = self.gpt_service.call_llm(
-                messages=messages,
-                model_type="gpt-4-vision-preview",
-                temperature=0.1,
-                max_tokens=1500
-            )
+            # 流式调用GPT服务，返回的JSON对象一完整就停止接收
+            content = self._request_model(messages, max_tokens=1500)
             
-            if response.get('success', False):
-                parsed_result = self._parse_analysis_result(response['content'], 'code_changes')
-                return {
+            if content.strip():
+                parsed_result = self._parse_analysis_result(content, 'code_changes')
+                return self._cache_result(cache_key, {
                     'success': True,
                     'comparison_result': parsed_result,
-                    'raw_response': response['content']
-                }
+                    'raw_response': content
+                })
             else:
                 return {
                     'success': False,
-                    'error': response.get('error', '比较分析失败')
+                    'error': '比较分析失败'
                 }
                 
         except Exception as e:
@@ -418,35 +631,48 @@ Image 2: Second screenshot
         """
         return self.analyze_code_screenshot(image, 'ide_detection')
     
-    def batch_analyze_screenshots(self, images: List[Union[str, np.ndarray]], analysis_type: str = 'code_analysis') -> List[Dict]:
+    def batch_analyze_screenshots(self, images: List[Union[str, np.ndarray]], analysis_type: str = 'code_analysis',
+                                  max_concurrency: int = _DEFAULT_MAX_CONCURRENCY) -> List[Dict]:
         """
         批量分析多个截图
         
         Args:
             images: 图像列表
             analysis_type: 分析类型
+            max_concurrency: 同时进行的模型调用数，为1时串行分析
             
         Returns:
-            分析结果列表
+            分析结果列表，顺序与输入图像一致
         """
-        results = []
-        
-        for i, image in enumerate(images):
+        def analyze(i: int) -> Dict:
             logger.info(f"分析截图 {i+1}/{len(images)}")
             
-            result = self.analyze_code_screenshot(image, analysis_type)
+            result = self.analyze_code_screenshot(images[i], analysis_type)
             result['image_index'] = i
-            
-            results.append(result)
+            return result
+        
+        return self._map_concurrently(analyze, range(len(images)), max_concurrency)
+    
+    @staticmethod
+    def _map_concurrently(func, items, max_concurrency: int) -> List:
+        """在线程池中对每个元素调用func，按输入顺序返回结果"""
+        items = list(items)
+        workers = min(max(max_concurrency, 1), len(items))
+        if workers <= 1:
+            return [func(item) for item in items]
         
-        return results
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(func, items))
     
-    def analyze_code_evolution(self, image_sequence: List[Union[str, np.ndarray]]) -> Dict:
+    def analyze_code_evolution(self, image_sequence: List[Union[str, np.ndarray]],
+                               max_concurrency: int = _DEFAULT_MAX_CONCURRENCY, detail: str = 'auto') -> Dict:
         """
         分析代码演化过程
         
         Args:
             image_sequence: 按时间顺序排列的代码截图序列
+            max_concurrency: 同时进行的相邻截图比较数，为1时串行比较
+            detail: 比较时的图像精度 (auto, low, high)
             
         Returns:
             代码演化分析结果
@@ -458,17 +684,28 @@ Image 2: Second screenshot
                     'error': '至少需要两个图像进行演化分析'
                 }
             
+            # 每帧只编码一次，相邻两次比较共用中间那帧的数据URI
+            prepared = [self._prepare_image_for_analysis(image) for image in image_sequence]
+            
+            def compare_step(i: int) -> Dict:
+                logger.info(f"分析演化步骤 {i}/{len(image_sequence)-1}")
+                if not prepared[i-1] or not prepared[i]:
+                    return {
+                        'success': False,
+                        'error': '图像处理失败'
+                    }
+                # 数据URI看不出尺寸，按原始图像决定精度
+                step_detail = self._resolve_detail(detail, 'code_changes', 'high', image_sequence[i-1], image_sequence[i])
+                return self.compare_code_screenshots(prepared[i-1], prepared[i], detail=step_detail)
+            
+            # 各相邻截图的比较互不依赖，并发调用模型
+            steps = range(1, len(image_sequence))
+            comparisons = self._map_concurrently(compare_step, steps, max_concurrency)
+            
             evolution_steps = []
             
             # 分析每个变化步骤
-            for i in range(1, len(image_sequence)):
-                prev_image = image_sequence[i-1]
-                curr_image = image_sequence[i]
-                
-                logger.info(f"分析演化步骤 {i}/{len(image_sequence)-1}")
-                
-                comparison = self.compare_code_screenshots(prev_image, curr_image)
-                
+            for i, comparison in zip(steps, comparisons):
                 if comparison['success']:
                     evolution_steps.append({
                         'step': i,
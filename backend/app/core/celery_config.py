@@ -0,0 +1,61 @@
+"""
+Celery配置
+
+celery_app通过config_from_object加载本模块，Worker与Beat共用同一份任务模块、路由和定时计划。
+"""
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Redis配置
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+broker_url = REDIS_URL
+result_backend = REDIS_URL
+
+# 任务模块：公共模块之外，可用环境变量CELERY_EXTRA_TASK_MODULES（逗号分隔）追加
+include = ["app.tasks.scheduled_tasks"] + [
+    module.strip()
+    for module in os.getenv("CELERY_EXTRA_TASK_MODULES", "").split(",")
+    if module.strip()
+]
+
+# 时区设置
+timezone = "Asia/Shanghai"
+enable_utc = True
+
+# 任务结果过期时间 (6小时)，结果只用于排查，不必在Redis中保留一整天
+result_expires = 21600
+
+# 任务序列化
+task_serializer = "json"
+accept_content = ["json"]
+result_serializer = "json"
+
+# 消息和结果用gzip压缩后再写入Redis，JSON内容压缩率高
+task_compression = "gzip"
+result_compression = "gzip"
+
+# 任务路由
+task_routes = {
+    "app.tasks.video_tasks.parse_video_task": {"queue": "video_parsing"},
+    "app.tasks.scheduled_tasks.execute_scheduled_task": {"queue": "scheduled"},
+}
+
+# Worker配置
+worker_prefetch_multiplier = 1
+task_acks_late = True
+worker_max_tasks_per_child = 1000
+
+# 错误重试配置
+task_default_retry_delay = 60
+task_max_retries = 3
+
+# 定时任务配置
+beat_schedule = {
+    "check-scheduled-tasks": {
+        "task": "app.tasks.scheduled_tasks.check_and_execute_scheduled_tasks",
+        "schedule": 60.0,  # 每60秒检查一次
+    },
+}
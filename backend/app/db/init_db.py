@@ -1,9 +1,14 @@
 from app.db.models.models import Model
 from app.db.models.providers import Provider
 from app.db.models.video_tasks import VideoTask
+from app.db.models.scheduled_tasks import ScheduledTask
 from app.db.engine import get_engine, Base
 
 def init_db():
     engine = get_engine()
 
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    Base.metadata.create_all(bind=engine)
+
+    # create_all不会给已存在的表补建索引，旧数据库在这里补上
+    for index in ScheduledTask.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
\ No newline at end of file
@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, func
+from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, Index, func
 from sqlalchemy.dialects.sqlite import JSON
 
 from app.db.engine import Base
@@ -7,6 +7,12 @@ from app.db.engine import Base
 
 class ScheduledTask(Base):
     __tablename__ = "scheduled_tasks"
+    __table_args__ = (
+        # Celery Beat每分钟轮询的待执行任务查询：enabled、status等值匹配后按next_run_time范围查找
+        Index("ix_sched_pending", "enabled", "status", "next_run_time"),
+        # 用户任务列表：按created_by过滤、按created_at排序
+        Index("ix_sched_owner", "created_by", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     task_name = Column(String(255), nullable=False)
@@ -15,7 +21,7 @@ class ScheduledTask(Base):
     
     # 调度配置
     schedule_time = Column(DateTime, nullable=False)
-    repeat_type = Column(String(20), default="once")  # once, daily, weekly, monthly
+    repeat_type = Column(String(20), default="once")  # once, hourly, daily, weekly, monthly
     enabled = Column(Boolean, default=True)
     
     # 任务配置 (JSON格式存储用户设置)
@@ -1,12 +1,32 @@
 from datetime import datetime, timedelta
+from dateutil.relativedelta import relativedelta
 from typing import List, Optional
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
+from sqlalchemy import Row, and_, or_, update
 
-from app.db.engine import get_db
+from app.db.engine import SessionLocal
 from app.db.models.scheduled_tasks import ScheduledTask
 
 
+# 任务列表展示用到的列，不含体积可能很大的task_config
+_SUMMARY_COLUMNS = (
+    ScheduledTask.id,
+    ScheduledTask.task_name,
+    ScheduledTask.video_url,
+    ScheduledTask.platform,
+    ScheduledTask.schedule_time,
+    ScheduledTask.next_run_time,
+    ScheduledTask.repeat_type,
+    ScheduledTask.enabled,
+    ScheduledTask.status,
+    ScheduledTask.run_count,
+    ScheduledTask.last_run_time,
+    ScheduledTask.last_task_id,
+    ScheduledTask.error_message,
+    ScheduledTask.created_at,
+)
+
+
 class ScheduledTaskDAO:
     """定时任务数据访问对象"""
     
@@ -22,7 +42,7 @@ class ScheduledTaskDAO:
         created_by: str = "user"
     ) -> ScheduledTask:
         """创建定时任务"""
-        with get_db() as db:
+        with SessionLocal() as db:
             scheduled_task = ScheduledTask(
                 task_name=task_name,
                 video_url=video_url,
@@ -42,22 +62,31 @@ class ScheduledTaskDAO:
     @staticmethod
     def get_scheduled_task_by_id(task_id: int) -> Optional[ScheduledTask]:
         """根据ID获取定时任务"""
-        with get_db() as db:
+        with SessionLocal() as db:
             return db.query(ScheduledTask).filter(ScheduledTask.id == task_id).first()
     
     @staticmethod
     def get_user_scheduled_tasks(created_by: str = "user", enabled_only: bool = False) -> List[ScheduledTask]:
         """获取用户的定时任务列表"""
-        with get_db() as db:
+        with SessionLocal() as db:
             query = db.query(ScheduledTask).filter(ScheduledTask.created_by == created_by)
             if enabled_only:
                 query = query.filter(ScheduledTask.enabled == True)
             return query.order_by(ScheduledTask.created_at.desc()).all()
     
+    @staticmethod
+    def list_user_tasks_summary(created_by: str = "user", enabled_only: bool = False) -> List[Row]:
+        """获取用户的定时任务列表摘要（只查询列表展示需要的列，不加载task_config）"""
+        with SessionLocal() as db:
+            query = db.query(*_SUMMARY_COLUMNS).filter(ScheduledTask.created_by == created_by)
+            if enabled_only:
+                query = query.filter(ScheduledTask.enabled == True)
+            return query.order_by(ScheduledTask.created_at.desc()).all()
+    
     @staticmethod
     def get_pending_tasks() -> List[ScheduledTask]:
         """获取待执行的定时任务（到达执行时间且状态为pending的启用任务）"""
-        with get_db() as db:
+        with SessionLocal() as db:
             now = datetime.now()
             return db.query(ScheduledTask).filter(
                 and_(
@@ -69,37 +98,82 @@ class ScheduledTaskDAO:
     
     @staticmethod
     def update_task_status(task_id: int, status: str, error_message: str = None, last_task_id: str = None):
-        """更新任务状态"""
-        with get_db() as db:
-            task = db.query(ScheduledTask).filter(ScheduledTask.id == task_id).first()
+        """更新任务状态（读取一次当前状态，再用一条UPDATE ... RETURNING写回）"""
+        with SessionLocal() as db:
+            task = db.get(ScheduledTask, task_id)
             if task:
-                task.status = status
-                task.last_run_time = datetime.now()
-                task.run_count += 1
+                values = {
+                    "status": status,
+                    "last_run_time": datetime.now(),
+                }
                 
                 if error_message:
-                    task.error_message = error_message
+                    values["error_message"] = error_message
                 if last_task_id:
-                    task.last_task_id = last_task_id
+                    values["last_task_id"] = last_task_id
                 
-                # 如果是重复任务且成功执行，计算下次执行时间
+                # 执行次数只在成功完成时累加一次
+                if status == "completed":
+                    values["run_count"] = ScheduledTask.run_count + 1
+                
+                # 如果是重复任务且成功执行，计算下次执行时间（run_count为本次之前已完成的次数）
                 if status == "completed" and task.repeat_type != "once":
-                    task.next_run_time = ScheduledTaskDAO._calculate_next_run_time(
+                    values["next_run_time"] = ScheduledTaskDAO._calculate_next_run_time(
                         task.schedule_time, task.repeat_type, task.run_count
                     )
-                    task.status = "pending"  # 重置为pending等待下次执行
-                elif task.repeat_type == "once":
-                    # 一次性任务完成后禁用
-                    task.enabled = False
+                    values["status"] = "pending"  # 重置为pending等待下次执行
+                elif task.repeat_type == "once" and status in ("completed", "failed"):
+                    # 一次性任务执行结束后禁用
+                    values["enabled"] = False
                 
+                stmt = (
+                    update(ScheduledTask)
+                    .where(ScheduledTask.id == task_id)
+                    .values(**values)
+                    .returning(ScheduledTask)
+                    .execution_options(populate_existing=True)
+                )
+                task = db.execute(stmt).scalar_one()
+                # 提交前移出会话，提交后返回的对象仍保留刚写入的属性
+                db.expunge(task)
                 db.commit()
-                db.refresh(task)
                 return task
     
+    @staticmethod
+    def claim_pending_tasks() -> List[ScheduledTask]:
+        """
+        领取待执行的定时任务
+        
+        用一条UPDATE ... RETURNING把到期的任务标记为运行中并返回，查询和标记在同一事务内完成，
+        多个Beat进程同时轮询也不会领取到同一个任务。标记的效果与update_task_status(task_id, "running")一致。
+        """
+        with SessionLocal() as db:
+            now = datetime.now()
+            stmt = (
+                update(ScheduledTask)
+                .where(
+                    and_(
+                        ScheduledTask.enabled == True,
+                        ScheduledTask.next_run_time <= now,
+                        ScheduledTask.status.in_(["pending", "failed"])  # 失败的任务也可以重试
+                    )
+                )
+                .values(
+                    status="running",
+                    last_run_time=now,
+                )
+                .returning(ScheduledTask)
+            )
+            tasks = db.execute(stmt).scalars().all()
+            # 提交前移出会话，提交后返回的对象仍保留已加载的属性
+            db.expunge_all()
+            db.commit()
+            return tasks
+    
     @staticmethod
     def toggle_task_enabled(task_id: int, enabled: bool) -> Optional[ScheduledTask]:
         """启用/禁用定时任务"""
-        with get_db() as db:
+        with SessionLocal() as db:
             task = db.query(ScheduledTask).filter(ScheduledTask.id == task_id).first()
             if task:
                 task.enabled = enabled
@@ -119,7 +193,7 @@ class ScheduledTaskDAO:
     @staticmethod
     def delete_scheduled_task(task_id: int) -> bool:
         """删除定时任务"""
-        with get_db() as db:
+        with SessionLocal() as db:
             task = db.query(ScheduledTask).filter(ScheduledTask.id == task_id).first()
             if task:
                 db.delete(task)
@@ -130,7 +204,7 @@ class ScheduledTaskDAO:
     @staticmethod
     def update_schedule_time(task_id: int, new_schedule_time: datetime) -> Optional[ScheduledTask]:
         """更新定时任务的执行时间"""
-        with get_db() as db:
+        with SessionLocal() as db:
             task = db.query(ScheduledTask).filter(ScheduledTask.id == task_id).first()
             if task:
                 task.schedule_time = new_schedule_time
@@ -143,12 +217,14 @@ class ScheduledTaskDAO:
     @staticmethod
     def _calculate_next_run_time(base_time: datetime, repeat_type: str, run_count: int) -> datetime:
         """计算下次执行时间"""
-        if repeat_type == "daily":
+        if repeat_type == "hourly":
+            return base_time + timedelta(hours=run_count + 1)
+        elif repeat_type == "daily":
             return base_time + timedelta(days=run_count + 1)
         elif repeat_type == "weekly":
             return base_time + timedelta(weeks=run_count + 1)
         elif repeat_type == "monthly":
-            # 简单处理月份，这里假设每月30天
-            return base_time + timedelta(days=(run_count + 1) * 30)
+            # 按自然月推算，日期超出当月天数时取当月最后一天（如1月31日的下个月为2月28/29日）
+            return base_time + relativedelta(months=run_count + 1)
         else:
             return base_time
\ No newline at end of file
@@ -1,21 +1,156 @@
 import os
 from abc import ABC
-from typing import Union, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Union, Optional
+import atexit
+from functools import lru_cache
 import random
-import time
+import shutil
+import subprocess
+import threading
 import logging
 
 import yt_dlp
 
 from app.downloaders.base import Downloader, DownloadQuality, QUALITY_MAP
 from app.models.notes_model import AudioDownloadResult
-from app.utils.path_helper import get_data_dir
+from app.utils.ffmpeg_pool import ffmpeg_pool
+from app.utils.path_helper import get_data_dir, wait_for_file
 from app.utils.url_parser import extract_video_id
 
+# 常见浏览器 User-Agent 列表
+_USER_AGENTS = (
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/113.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.4 Safari/605.1.15',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/113.0.0.0 Safari/537.36 Edg/113.0.1774.42',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/113.0',
+)
+
+# 请求头模板，User-Agent 每次下载随机选择
+_BASE_HEADERS = {
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
+    'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
+    'Referer': 'https://www.bilibili.com/',
+    'Origin': 'https://www.bilibili.com',
+}
+
+# yt-dlp 公共参数模板，outtmpl 和 http_headers 调用时补充
+_BASE_OPTS = {
+    'noplaylist': True,
+    'quiet': False,
+    # 添加重试和连接设置
+    'retries': 10,             # 重试10次
+    'fragment_retries': 10,    # 片段下载重试10次
+    'socket_timeout': 30,      # 套接字超时时间30秒
+    'extractor_retries': 5,    # 提取器重试5次
+    'nocheckcertificate': True, # 不检查SSL证书
+}
+
+# 只下载原始音频流，不用 yt-dlp 的后处理器转码：mp3 转码由 _transcode_to_mp3 经 ffmpeg_pool 限流执行
+_BASE_RAW_AUDIO_OPTS = {
+    **_BASE_OPTS,
+    'format': 'bestaudio[ext=m4a]/bestaudio/best',
+}
+
+# 下载视频
+_BASE_VIDEO_OPTS = {
+    **_BASE_OPTS,
+    'format': 'bv*[ext=mp4]/bestvideo+bestaudio/best',
+    'merge_output_format': 'mp4',  # 确保合并成 mp4
+}
+
+# 批量下载时同时进行的网络下载数
+_BATCH_DOWNLOAD_WORKERS = 4
+# 批量下载时转码线程数，ffmpeg 是 CPU 密集型，按核数开
+_BATCH_TRANSCODE_WORKERS = os.cpu_count() or 2
+# 装了 aria2c 时交给它下载：多连接分段拉取，分片格式（DASH/HLS）提速明显
+_ARIA2C_OPTS = {
+    'external_downloader': 'aria2c',
+    'external_downloader_args': {
+        'aria2c': ['-x', '16', '-s', '16', '-k', '1M', '--file-allocation=none']
+    },
+}
+# yt-dlp 合并视频时可能产出的容器格式
+_VIDEO_EXTENSIONS = ('mp4', 'mkv', 'webm', 'm4v')
+
+
+@lru_cache(maxsize=16)
+def _list_dir(directory: str, mtime_ns: int) -> tuple:
+    """
+    目录下的文件名列表，目录 mtime 参与缓存键，有文件增删时自动失效
+    """
+    with os.scandir(directory) as entries:
+        return tuple(entry.name for entry in entries if entry.is_file())
+
+
+def _find_downloaded_video(output_dir: str, video_id: str) -> Optional[str]:
+    """
+    查找已下载的视频文件，不限定扩展名（merge_output_format 只是提示，可能产出 mkv/webm）
+    """
+    for name in _list_dir(output_dir, os.stat(output_dir).st_mtime_ns):
+        stem, _, ext = name.rpartition('.')
+        if stem == video_id and ext in _VIDEO_EXTENSIONS:
+            return os.path.join(output_dir, name)
+    return None
+
 
 class BilibiliDownloader(Downloader, ABC):
     def __init__(self):
         super().__init__()
+        # 下载器是全局单例、会被多个线程同时使用，而 YoutubeDL 的参数在调用时会被修改，
+        # 所以按线程缓存实例；同一线程内复用提取器和 HTTP 连接，避免每次下载重新握手
+        self._ydl_local = threading.local()
+        self._ydl_instances = []
+        self._ydl_lock = threading.Lock()
+        # 批量下载的两级线程池，首次使用时创建
+        self._dl_pool = None
+        self._pp_pool = None
+        # 没有 aria2c 时使用 yt-dlp 自带的下载器
+        self._external_downloader_opts = _ARIA2C_OPTS if shutil.which('aria2c') else {}
+        atexit.register(self._close_ydl_instances)
+
+    @staticmethod
+    def _build_opts(base_opts: dict, output_dir: str) -> dict:
+        """
+        在模块级参数模板上补充输出路径和随机选择的 User-Agent
+        """
+        return {
+            **base_opts,
+            'outtmpl': os.path.join(output_dir, "%(id)s.%(ext)s"),
+            'http_headers': {**_BASE_HEADERS, 'User-Agent': random.choice(_USER_AGENTS)},
+        }
+
+    def _get_ydl(self, kind: str, output_dir: str, base_opts: dict) -> yt_dlp.YoutubeDL:
+        """
+        获取当前线程缓存的 YoutubeDL 实例，按下载类型和输出目录区分
+
+        User-Agent 在创建实例时随机选定，之后不再替换：yt-dlp 首次请求时就用当时的请求头
+        建好请求处理器并缓存，之后改 params 只会影响媒体下载，提取信息的请求仍用旧值
+        """
+        cache = getattr(self._ydl_local, 'cache', None)
+        if cache is None:
+            cache = self._ydl_local.cache = {}
+        key = (kind, output_dir)
+        ydl = cache.get(key)
+        if ydl is None:
+            ydl = yt_dlp.YoutubeDL({**self._build_opts(base_opts, output_dir), **self._external_downloader_opts})
+            cache[key] = ydl
+            with self._ydl_lock:
+                self._ydl_instances.append(ydl)
+        return ydl
+
+    def _close_ydl_instances(self):
+        with self._ydl_lock:
+            instances, self._ydl_instances = self._ydl_instances, []
+            pools, self._dl_pool, self._pp_pool = (self._dl_pool, self._pp_pool), None, None
+        for pool in pools:
+            if pool is not None:
+                pool.shutdown(wait=False)
+        for ydl in instances:
+            try:
+                ydl.close()
+            except Exception:
+                pass
 
     def download(
         self,
@@ -30,94 +165,33 @@ class BilibiliDownloader(Downloader, ABC):
             output_dir=self.cache_data
         os.makedirs(output_dir, exist_ok=True)
 
-        output_path = os.path.join(output_dir, "%(id)s.%(ext)s")
-        
-        # 常见浏览器 User-Agent 列表
-        user_agents = [
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/113.0.0.0 Safari/537.36',
-            'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.4 Safari/605.1.15',
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/113.0.0.0 Safari/537.36 Edg/113.0.1774.42',
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/113.0'
-        ]
-        
-        # 随机选择一个User-Agent
-        user_agent = random.choice(user_agents)
-
-        # 尝试使用yt-dlp
-        ydl_opts = {
-            'format': 'bestaudio[ext=m4a]/bestaudio/best',
-            'outtmpl': output_path,
-            'postprocessors': [
-                {
-                    'key': 'FFmpegExtractAudio',
-                    'preferredcodec': 'mp3',
-                    'preferredquality': '64',
-                }
-            ],
-            'noplaylist': True,
-            'quiet': False,
-            # 添加重试和连接设置
-            'retries': 10,             # 重试10次
-            'fragment_retries': 10,    # 片段下载重试10次
-            'socket_timeout': 30,      # 套接字超时时间30秒
-            'extractor_retries': 5,    # 提取器重试5次
-            'nocheckcertificate': True, # 不检查SSL证书
-            'http_headers': {
-                'User-Agent': user_agent,
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
-                'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-                'Referer': 'https://www.bilibili.com/',
-                'Origin': 'https://www.bilibili.com'
-            }
-        }
-
-        info = None
         try:
             print("尝试使用 yt-dlp 下载...")
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                print(f"正在使用User-Agent: {user_agent}")
-                print(f"尝试下载视频: {video_url}")
-                info = ydl.extract_info(video_url, download=True)
-                video_id = info.get("id")
-                title = info.get("title")
-                duration = info.get("duration", 0)
-                cover_url = info.get("thumbnail")
-                audio_path = os.path.join(output_dir, f"{video_id}.mp3")
-                print(f"下载成功: {title}")
+            ydl = self._get_ydl('raw_audio', output_dir, _BASE_RAW_AUDIO_OPTS)
+            print(f"正在使用User-Agent: {ydl.params['http_headers'].get('User-Agent')}")
+            print(f"尝试下载视频: {video_url}")
+            info, raw_path = self._download_raw_audio(video_url, output_dir)
+            print(f"下载成功: {info.get('title')}")
         except Exception as e:
             print(f"yt-dlp 下载失败，错误信息: {str(e)}")
             print("尝试使用备选下载器 youtube-dl...")
             
             # 失败后尝试使用 yt_dlp
             try:
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    print(f"正在使用 youtube-dl 下载: {video_url}")
-                    info = ydl.extract_info(video_url, download=True)
-                    video_id = info.get("id")
-                    title = info.get("title")
-                    duration = info.get("duration", 0)
-                    cover_url = info.get("thumbnail")
-                    audio_path = os.path.join(output_dir, f"{video_id}.mp3")
-                    print(f"youtube-dl 下载成功: {title}")
+                print(f"正在使用 youtube-dl 下载: {video_url}")
+                info, raw_path = self._download_raw_audio(video_url, output_dir)
+                print(f"youtube-dl 下载成功: {info.get('title')}")
             except Exception as e2:
                 print(f"youtube-dl 也下载失败，错误信息: {str(e2)}")
                 raise Exception(f"所有下载方法都失败: yt-dlp错误: {str(e)}, youtube-dl错误: {str(e2)}")
 
-        if not info:
-            raise Exception("无法获取视频信息")
-            
-        # 检查下载是否成功
+        # 转成 mp3，与批量下载共用 ffmpeg_pool 的并发名额
         video_id = info.get("id")
         audio_path = os.path.join(output_dir, f"{video_id}.mp3")
+        self._transcode_to_mp3(raw_path, audio_path)
         
-        # 等待5秒确保文件写入完成
-        for _ in range(5):
-            if os.path.exists(audio_path):
-                break
-            print(f"等待文件写入: {audio_path}")
-            time.sleep(1)
-
-        if not os.path.exists(audio_path):
+        # 最多等待5秒确保文件写入完成
+        if not wait_for_file(audio_path, timeout=5.0):
             print(f"警告：下载可能成功但找不到文件: {audio_path}")
             
         return AudioDownloadResult(
@@ -131,6 +205,88 @@ class BilibiliDownloader(Downloader, ABC):
             video_path=None  # ❗音频下载不包含视频路径
         )
 
+    def download_batch(
+        self,
+        video_urls: List[str],
+        output_dir: Union[str, None] = None,
+    ) -> List[Optional[AudioDownloadResult]]:
+        """
+        批量下载音频，网络下载和 ffmpeg 转码流水线并行
+
+        下载线程只拉取原始音频流，每个下载完成后立即交给转码线程池，
+        同时下一个链接继续下载。返回结果与 video_urls 顺序一致，失败的位置为 None
+        """
+        if output_dir is None:
+            output_dir = get_data_dir()
+        if not output_dir:
+            output_dir = self.cache_data
+        os.makedirs(output_dir, exist_ok=True)
+
+        with self._ydl_lock:
+            if self._dl_pool is None:
+                self._dl_pool = ThreadPoolExecutor(max_workers=_BATCH_DOWNLOAD_WORKERS, thread_name_prefix='bili-dl')
+                self._pp_pool = ThreadPoolExecutor(max_workers=_BATCH_TRANSCODE_WORKERS, thread_name_prefix='bili-pp')
+
+        results: List[Optional[AudioDownloadResult]] = [None] * len(video_urls)
+        download_futures = {
+            self._dl_pool.submit(self._download_raw_audio, url, output_dir): i
+            for i, url in enumerate(video_urls)
+        }
+
+        transcode_futures = {}
+        for future in as_completed(download_futures):
+            i = download_futures[future]
+            try:
+                info, raw_path = future.result()
+            except Exception as e:
+                print(f"批量下载失败: {video_urls[i]}，错误信息: {str(e)}")
+                continue
+            audio_path = os.path.join(output_dir, f"{info.get('id')}.mp3")
+            transcode_futures[self._pp_pool.submit(self._transcode_to_mp3, raw_path, audio_path)] = (i, info, audio_path)
+
+        for future in as_completed(transcode_futures):
+            i, info, audio_path = transcode_futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                print(f"音频转码失败: {video_urls[i]}，错误信息: {str(e)}")
+                continue
+            results[i] = AudioDownloadResult(
+                file_path=audio_path,
+                title=info.get("title"),
+                duration=info.get("duration", 0),
+                cover_url=info.get("thumbnail"),
+                platform="bilibili",
+                video_id=info.get("id"),
+                raw_info=info,
+                video_path=None
+            )
+
+        return results
+
+    def _download_raw_audio(self, video_url: str, output_dir: str):
+        """
+        只下载原始音频流（不转码），返回视频信息和下载文件路径
+        """
+        ydl = self._get_ydl('raw_audio', output_dir, _BASE_RAW_AUDIO_OPTS)
+        info = ydl.extract_info(video_url, download=True)
+        if not info:
+            raise Exception("无法获取视频信息")
+        return info, ydl.prepare_filename(info)
+
+    @staticmethod
+    def _transcode_to_mp3(raw_path: str, audio_path: str):
+        """
+        用 ffmpeg 把原始音频转成 64k mp3，成功后删除原始文件；下载到的已经是 mp3 时直接使用
+        """
+        if raw_path == audio_path:
+            return
+        command = ['ffmpeg', '-y', '-i', raw_path, '-vn', '-b:a', '64k', audio_path]
+        result = ffmpeg_pool.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.decode('utf-8', errors='ignore')[-500:])
+        os.remove(raw_path)
+
     def download_video(
         self,
         video_url: str,
@@ -145,72 +301,42 @@ class BilibiliDownloader(Downloader, ABC):
         os.makedirs(output_dir, exist_ok=True)
         print("video_url",video_url)
         video_id=extract_video_id(video_url, "bilibili")
+        existing_path = _find_downloaded_video(output_dir, video_id)
+        if existing_path:
+            return existing_path
         video_path = os.path.join(output_dir, f"{video_id}.mp4")
-        if os.path.exists(video_path):
-            return video_path
-
-        # 常见浏览器 User-Agent 列表
-        user_agents = [
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/113.0.0.0 Safari/537.36',
-            'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.4 Safari/605.1.15',
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/113.0.0.0 Safari/537.36 Edg/113.0.1774.42',
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/113.0'
-        ]
-        
-        # 随机选择一个User-Agent
-        user_agent = random.choice(user_agents)
-
-        output_path = os.path.join(output_dir, "%(id)s.%(ext)s")
-
-        ydl_opts = {
-            'format': 'bv*[ext=mp4]/bestvideo+bestaudio/best',
-            'outtmpl': output_path,
-            'noplaylist': True,
-            'quiet': False,
-            'merge_output_format': 'mp4',  # 确保合并成 mp4
-            # 添加重试和连接设置
-            'retries': 10,             # 重试10次
-            'fragment_retries': 10,    # 片段下载重试10次
-            'socket_timeout': 30,      # 套接字超时时间30秒
-            'extractor_retries': 5,    # 提取器重试5次
-            'nocheckcertificate': True, # 不检查SSL证书
-            'http_headers': {
-                'User-Agent': user_agent,
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
-                'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-                'Referer': 'https://www.bilibili.com/',
-                'Origin': 'https://www.bilibili.com'
-            }
-        }
 
         info = None
         try:
             print("尝试使用 yt-dlp 下载视频...")
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                print(f"正在使用User-Agent: {user_agent}")
-                print(f"尝试下载视频: {video_url}")
-                info = ydl.extract_info(video_url, download=True)
-                video_id = info.get("id")
-                video_path = os.path.join(output_dir, f"{video_id}.mp4")
-                print(f"下载成功: {video_path}")
+            ydl = self._get_ydl('video', output_dir, _BASE_VIDEO_OPTS)
+            print(f"正在使用User-Agent: {ydl.params['http_headers'].get('User-Agent')}")
+            print(f"尝试下载视频: {video_url}")
+            info = ydl.extract_info(video_url, download=True)
+            video_id = info.get("id")
+            video_path = os.path.join(output_dir, f"{video_id}.mp4")
+            print(f"下载成功: {video_path}")
         except Exception as e:
             print(f"yt-dlp 下载视频失败，错误信息: {str(e)}")
             print("尝试使用备选下载器 youtube-dl...")
             
             # 失败后尝试使用 yt_dlp
             try:
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    print(f"正在使用 youtube-dl 下载视频: {video_url}")
-                    info = ydl.extract_info(video_url, download=True)
-                    video_id = info.get("id")
-                    video_path = os.path.join(output_dir, f"{video_id}.mp4")
-                    print(f"youtube-dl 下载视频成功: {video_path}")
+                ydl = self._get_ydl('video', output_dir, _BASE_VIDEO_OPTS)
+                print(f"正在使用 youtube-dl 下载视频: {video_url}")
+                info = ydl.extract_info(video_url, download=True)
+                video_id = info.get("id")
+                video_path = os.path.join(output_dir, f"{video_id}.mp4")
+                print(f"youtube-dl 下载视频成功: {video_path}")
             except Exception as e2:
                 print(f"youtube-dl 也下载视频失败，错误信息: {str(e2)}")
                 raise Exception(f"所有下载视频方法都失败: yt-dlp错误: {str(e)}, youtube-dl错误: {str(e2)}")
 
         if not os.path.exists(video_path):
-            raise FileNotFoundError(f"视频文件未找到: {video_path}")
+            downloaded_path = _find_downloaded_video(output_dir, info.get("id")) if info else None
+            if not downloaded_path:
+                raise FileNotFoundError(f"视频文件未找到: {video_path}")
+            video_path = downloaded_path
 
         return video_path
 
@@ -218,8 +344,8 @@ class BilibiliDownloader(Downloader, ABC):
         """
         删除视频文件
         """
-        if os.path.exists(video_path):
+        try:
             os.remove(video_path)
             return f"视频文件已删除: {video_path}"
-        else:
+        except FileNotFoundError:
             return f"视频文件未找到: {video_path}"
\ No newline at end of file
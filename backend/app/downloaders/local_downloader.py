@@ -1,6 +1,7 @@
 import os
 import subprocess
 from abc import ABC
+from functools import lru_cache
 from typing import Optional
 
 from app.downloaders.base import Downloader
@@ -9,9 +10,59 @@ from app.models.audio_model import AudioDownloadResult
 import os
 import subprocess
 
+from app.utils.ffmpeg_pool import ffmpeg_pool
+from app.utils.path_helper import stat_or_none
 from app.utils.video_helper import save_cover_to_static
 
 
+@lru_cache(maxsize=128)
+def _probe_audio_codec(path: str, mtime_ns: int, size: int) -> Optional[str]:
+    """
+    获取文件第一条音轨的编码名，mtime 和 size 参与缓存键，文件变化后重新探测
+    """
+    command = [
+        'ffprobe',
+        '-v', 'quiet',
+        '-select_streams', 'a:0',
+        '-show_entries', 'stream=codec_name',
+        '-of', 'default=nw=1:nk=1',
+        path
+    ]
+    try:
+        result = subprocess.run(command, capture_output=True, text=True, timeout=30, check=False)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    if result.returncode != 0:
+        return None
+    return result.stdout.strip() or None
+
+
+def probe_audio_codec(path: str) -> Optional[str]:
+    st = os.stat(path)
+    return _probe_audio_codec(path, st.st_mtime_ns, st.st_size)
+
+
+def _prefetch_file(path: str):
+    """
+    提示内核预读整个文件到页缓存，后续 ffmpeg 多次读取同一输入（修复、重试、单独提取封面）时直接命中缓存
+    不支持 posix_fadvise 的平台（Windows、macOS）直接跳过
+    """
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        # WILLNEED 作用于文件的页缓存，关闭 fd 后对其他进程同样有效；
+        # SEQUENTIAL 只影响本次打开的 fd，这里用不上
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
 class LocalDownloader(Downloader, ABC):
     def __init__(self):
 
@@ -46,7 +97,7 @@ class LocalDownloader(Downloader, ABC):
         ]
 
         try:
-            result = subprocess.run(
+            result = ffmpeg_pool.run(
                 command, 
                 stdout=subprocess.PIPE, 
                 stderr=subprocess.PIPE, 
@@ -70,7 +121,7 @@ class LocalDownloader(Downloader, ABC):
                     output_path
                 ]
                 
-                fallback_result = subprocess.run(
+                fallback_result = ffmpeg_pool.run(
                     fallback_command,
                     stdout=subprocess.PIPE,
                     stderr=subprocess.PIPE,
@@ -83,7 +134,8 @@ class LocalDownloader(Downloader, ABC):
                     from app.utils.video_helper import _create_placeholder_image
                     return _create_placeholder_image(output_path, "无法提取封面")
 
-            if not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
+            st = stat_or_none(output_path)
+            if st is None or st.st_size == 0:
                 from app.utils.video_helper import _create_placeholder_image
                 return _create_placeholder_image(output_path, "封面提取失败")
 
@@ -108,21 +160,105 @@ class LocalDownloader(Downloader, ABC):
             base, _ = os.path.splitext(input_path)
             output_path = base + ".mp3"
 
+        # 音轨本身就是 mp3 时直接复制流，不需要解码再编码
+        if probe_audio_codec(input_path) == 'mp3':
+            if os.path.abspath(input_path) == os.path.abspath(output_path):
+                return output_path
+            if self._copy_mp3_stream(input_path, output_path):
+                print(f"音频转换成功（直接复制音轨）: {output_path}")
+                return output_path
+
         # 使用安全的音频提取工具
         from app.utils.video_repair import safe_extract_audio
         
-        success, error_msg = safe_extract_audio(
-            input_path,
-            output_path,
-            bitrate="128k",
-            repair_if_needed=True
-        )
+        with ffmpeg_pool.slot():
+            success, error_msg = safe_extract_audio(
+                input_path,
+                output_path,
+                bitrate="128k",
+                repair_if_needed=True
+            )
         
         if success:
             print(f"音频转换成功: {output_path}")
             return output_path
         else:
             raise RuntimeError(f"音频转换失败: {error_msg}")
+
+    @staticmethod
+    def _copy_mp3_stream(input_path: str, output_path: str) -> bool:
+        """
+        不重新编码，把 mp3 音轨直接复制到输出文件，失败返回 False
+        """
+        command = ['ffmpeg', '-i', input_path, '-vn', '-acodec', 'copy', '-y', output_path]
+        try:
+            result = ffmpeg_pool.run(
+                command,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                timeout=300,
+                check=False
+            )
+        except (OSError, subprocess.TimeoutExpired) as e:
+            print(f"复制音轨失败，改为重新编码: {e}")
+            return False
+        st = stat_or_none(output_path)
+        if result.returncode != 0 or st is None or st.st_size == 0:
+            print(f"复制音轨失败，改为重新编码: {result.stderr[-500:]}")
+            return False
+        return True
+
+    def _extract_audio_and_cover(self, input_path: str):
+        """
+        用一次ffmpeg调用同时生成mp3和封面，返回 (音频路径, 封面路径)，未成功生成的一项为 None
+        """
+        base, _ = os.path.splitext(input_path)
+        audio_out = base + ".mp3"
+        cover_out = os.path.join(
+            os.path.dirname(input_path),
+            f"{os.path.splitext(os.path.basename(input_path))[0]}_cover.jpg"
+        )
+        # 输入本身就是mp3时没有画面，也不能覆盖输入文件，交给单独的处理流程
+        if os.path.abspath(input_path) == os.path.abspath(audio_out):
+            return None, None
+
+        audio_args = ['-acodec', 'copy'] if probe_audio_codec(input_path) == 'mp3' else ['-b:a', '128k']
+        command = [
+            'ffmpeg',
+            '-err_detect', 'ignore_err',
+            '-fflags', '+discardcorrupt',
+            '-i', input_path,
+            # 封面输出：跳到第1秒截一帧，防止黑屏
+            '-ss', '00:00:01', '-vframes', '1', '-q:v', '2', '-y', cover_out,
+            # 音频输出
+            '-vn', *audio_args, '-y', audio_out
+        ]
+
+        try:
+            result = ffmpeg_pool.run(
+                command,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                timeout=300,
+                check=False
+            )
+        except (OSError, subprocess.TimeoutExpired) as e:
+            print(f"合并提取音频和封面失败，改为分别处理: {e}")
+            return None, None
+
+        if result.returncode != 0:
+            # 输出可能不完整，交给带修复能力的单独流程重新生成
+            print(f"合并提取音频和封面失败，改为分别处理: {result.stderr[-500:]}")
+            return None, None
+
+        def produced(path: str) -> Optional[str]:
+            st = stat_or_none(path)
+            if st is not None and st.st_size > 0:
+                return path
+            return None
+
+        return produced(audio_out), produced(cover_out)
+
     def download_video(self, video_url: str, output_dir: str = None) -> str:
         """
         处理本地文件路径，返回视频文件路径
@@ -158,8 +294,13 @@ class LocalDownloader(Downloader, ABC):
         file_name = os.path.basename(video_url)
         title, _ = os.path.splitext(file_name)
         print(title, file_name,video_url)
-        file_path=self.convert_to_mp3(video_url)
-        cover_path = self.extract_cover(video_url)
+        _prefetch_file(video_url)
+        # 一次ffmpeg调用同时输出音频和封面，只解析一次输入文件；哪个没产出就单独补做
+        file_path, cover_path = self._extract_audio_and_cover(video_url)
+        if file_path is None:
+            file_path = self.convert_to_mp3(video_url)
+        if cover_path is None:
+            cover_path = self.extract_cover(video_url)
         cover_url = save_cover_to_static(cover_path)
 
         print('file——path',file_path)
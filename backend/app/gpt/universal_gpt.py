@@ -150,6 +150,28 @@ class UniversalGPT(GPT):
         error_type = type(last_exception).__name__ if last_exception else "UnknownError"
         raise Exception(f"GPT调用失败 {chunk_info}，已重试{MAX_RETRIES}次。最后错误类型: {error_type}，错误信息: {str(last_exception)}")
 
+    def call_llm_stream(self, messages: list, model_type: str = None, temperature: float = None,
+                        max_tokens: int = None, max_retries: int = None):
+        """
+        流式调用模型，逐段产出回复文本
+        调用方提前关闭生成器时会同时关闭响应流，不再接收剩余内容
+        max_retries 覆盖SDK自带的重试次数，调用方自己做重试时传0，避免两层重试叠加
+        """
+        params = {
+            "model": model_type or self.model,
+            "messages": messages,
+            "temperature": self.temperature if temperature is None else temperature,
+            "stream": True,
+        }
+        if max_tokens is not None:
+            params["max_tokens"] = max_tokens
+
+        client = self.client if max_retries is None else self.client.with_options(max_retries=max_retries)
+        with client.chat.completions.create(**params) as stream:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+
     def _format_user_friendly_error(self, error: Exception, stage: str = "") -> str:
         """
         将技术错误信息转换为用户友好的描述
@@ -17,7 +17,7 @@ class ScheduledTaskRequest(BaseModel):
     platform: str
     schedule_time: Optional[datetime] = None
     delay_minutes: Optional[int] = None
-    repeat_type: str = "once"  # once, daily, weekly, monthly
+    repeat_type: str = "once"  # once, hourly, daily, weekly, monthly
     enabled: bool = True
     
     # 笔记生成配置
@@ -54,8 +54,8 @@ class ScheduledTaskRequest(BaseModel):
     
     @field_validator("repeat_type")
     def validate_repeat_type(cls, v):
-        if v not in ["once", "daily", "weekly", "monthly"]:
-            raise ValueError("重复类型必须是 once, daily, weekly, monthly 中的一个")
+        if v not in ["once", "hourly", "daily", "weekly", "monthly"]:
+            raise ValueError("重复类型必须是 once, hourly, daily, weekly, monthly 中的一个")
         return v
 
 
@@ -141,7 +141,8 @@ def create_scheduled_task(data: ScheduledTaskRequest):
 def get_scheduled_tasks(enabled_only: bool = False):
     """获取定时任务列表"""
     try:
-        tasks = ScheduledTaskDAO.get_user_scheduled_tasks(enabled_only=enabled_only)
+        # 列表只查询展示需要的列，task_config由任务详情接口返回
+        tasks = ScheduledTaskDAO.list_user_tasks_summary(enabled_only=enabled_only)
         
         result = []
         for task in tasks:
@@ -159,8 +160,7 @@ def get_scheduled_tasks(enabled_only: bool = False):
                 "last_run_time": task.last_run_time.isoformat() if task.last_run_time else None,
                 "last_task_id": task.last_task_id,
                 "error_message": task.error_message,
-                "created_at": task.created_at.isoformat(),
-                "task_config": task.task_config
+                "created_at": task.created_at.isoformat()
             })
         
         return R.success(result)
@@ -14,16 +14,13 @@ logger = get_task_logger(__name__)
 def check_and_execute_scheduled_tasks(self):
     """检查并执行到时的定时任务"""
     try:
-        # 获取所有待执行的定时任务
-        pending_tasks = ScheduledTaskDAO.get_pending_tasks()
+        # 领取所有到期的定时任务，领取的同时即标记为运行中
+        pending_tasks = ScheduledTaskDAO.claim_pending_tasks()
         
         logger.info(f"检查到 {len(pending_tasks)} 个待执行的定时任务")
         
         for scheduled_task in pending_tasks:
             try:
-                # 标记任务为运行中
-                ScheduledTaskDAO.update_task_status(scheduled_task.id, "running")
-                
                 # 创建异步执行任务
                 execute_scheduled_task.delay(scheduled_task.id)
                 
@@ -0,0 +1,32 @@
+"""
+ffmpeg 子进程的统一入口
+限制同时运行的 ffmpeg 进程数，批量处理或多个请求并发时不会开出远多于 CPU 核数的转码进程互相抢占
+"""
+import os
+import subprocess
+import threading
+from contextlib import contextmanager
+
+# 同时运行的 ffmpeg 进程上限，默认按 CPU 核数
+_MAX_PROCESSES = int(os.getenv('FFMPEG_MAX_PROCESSES', os.cpu_count() or 2))
+
+
+class FFmpegPool:
+    """ffmpeg 进程并发控制"""
+
+    def __init__(self, max_processes: int = _MAX_PROCESSES):
+        self._slots = threading.BoundedSemaphore(max(1, max_processes))
+
+    @contextmanager
+    def slot(self):
+        """占用一个 ffmpeg 进程名额，自行用 Popen 启动进程时使用"""
+        with self._slots:
+            yield
+
+    def run(self, command, **kwargs) -> subprocess.CompletedProcess:
+        """与 subprocess.run 参数一致，名额用满时等待"""
+        with self._slots:
+            return subprocess.run(command, **kwargs)
+
+
+ffmpeg_pool = FFmpegPool()
@@ -1,6 +1,14 @@
 import os
 import sys
+import time
 from pathlib import Path
+from typing import Optional
+
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+    INOTIFY_AVAILABLE = sys.platform.startswith('linux')
+except ImportError:
+    INOTIFY_AVAILABLE = False
 
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
 
@@ -47,4 +55,48 @@ def get_app_dir(subdir: str = "") -> str:
 
     full_path = os.path.join(base_dir, subdir)
     os.makedirs(full_path, exist_ok=True)
-    return full_path
\ No newline at end of file
+    return full_path
+
+def stat_or_none(path: str) -> Optional[os.stat_result]:
+    """
+    一次 stat 同时判断存在和获取大小，代替 exists + getsize 两次系统调用；文件不存在返回 None
+    """
+    try:
+        return os.stat(path)
+    except FileNotFoundError:
+        return None
+
+
+def wait_for_file(path: str, timeout: float = 5.0) -> bool:
+    """
+    等待文件出现，超时返回 False
+    - Linux 且装了 inotify_simple：监听目录的写入关闭/移入事件，文件一出现立即返回
+    - 其他情况：从 10ms 开始轮询，间隔逐次翻倍到 200ms
+    """
+    if os.path.exists(path):
+        return True
+
+    deadline = time.monotonic() + timeout
+    directory = os.path.dirname(path) or "."
+    if INOTIFY_AVAILABLE and os.path.isdir(directory):
+        name = os.path.basename(path)
+        with INotify() as inotify:
+            inotify.add_watch(directory, inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO)
+            # 注册监听前文件可能已经写完
+            if os.path.exists(path):
+                return True
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                for event in inotify.read(timeout=int(remaining * 1000)):
+                    if event.name == name:
+                        return True
+
+    delay = 0.01
+    while time.monotonic() < deadline:
+        time.sleep(min(delay, max(deadline - time.monotonic(), 0)))
+        if os.path.exists(path):
+            return True
+        delay = min(delay * 2, 0.2)
+    return False
@@ -0,0 +1 @@
+# 放在 backend 根目录，pytest 会把该目录加入 sys.path，测试中可以直接 import app
@@ -0,0 +1,20 @@
+import numpy as np
+
+from app.code_recognition.vision.ide_detector import IDEDetector
+
+
+def test_mutating_result_does_not_change_cached_result():
+    detector = IDEDetector()
+    image = np.full((600, 900, 3), 30, dtype=np.uint8)
+    image[:, :200] = 50
+    image[-20:] = (0, 122, 204)
+
+    first = detector.detect_ide(image)
+    assert first['success']
+    expected = sorted(first['ui_elements'])
+    first['ui_elements']['injected'] = {'detected': True}
+    first['overall_features'].clear()
+
+    second = detector.detect_ide(image)
+    assert sorted(second['ui_elements']) == expected
+    assert second['overall_features']
@@ -0,0 +1,15 @@
+from app.code_recognition.parser.language_detector import LanguageDetector
+
+
+def test_mutating_result_does_not_change_cached_result():
+    detector = LanguageDetector()
+    code = "def add(a, b):\n    return a + b\n"
+
+    first = detector.detect_language(code)
+    expected = first['details']['keyword_matches'].copy()
+    first['details']['keyword_matches']['x'] = 1
+    first['all_scores'].clear()
+
+    second = detector.detect_language(code)
+    assert second['details']['keyword_matches'] == expected
+    assert second['all_scores']
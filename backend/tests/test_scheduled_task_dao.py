@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db import scheduled_task_dao
+from app.db.engine import Base
+from app.db.models.scheduled_tasks import ScheduledTask
+from app.db.scheduled_task_dao import ScheduledTaskDAO
+
+
+@pytest.fixture(autouse=True)
+def memory_db(monkeypatch):
+    """DAO 改用内存 SQLite，每个用例独立建表"""
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(engine, tables=[ScheduledTask.__table__])
+    monkeypatch.setattr(scheduled_task_dao, "SessionLocal", sessionmaker(autoflush=False, bind=engine))
+    yield
+    engine.dispose()
+
+
+def _create_task(repeat_type: str) -> ScheduledTask:
+    schedule_time = (datetime.now() - timedelta(minutes=1)).replace(microsecond=0)
+    return ScheduledTaskDAO.create_scheduled_task(
+        task_name="test",
+        video_url="https://www.bilibili.com/video/BV1xx411c7mD",
+        platform="bilibili",
+        schedule_time=schedule_time,
+        task_config={},
+        repeat_type=repeat_type,
+    )
+
+
+def test_daily_task_next_run_is_one_day_after_first_run():
+    task = _create_task("daily")
+
+    claimed = ScheduledTaskDAO.claim_pending_tasks()
+    assert [t.id for t in claimed] == [task.id]
+    assert claimed[0].status == "running"
+    assert claimed[0].run_count == 0
+
+    done = ScheduledTaskDAO.update_task_status(task.id, "completed")
+    assert done.run_count == 1
+    assert done.status == "pending"
+    assert done.enabled
+    assert done.next_run_time == task.schedule_time + timedelta(days=1)
+
+
+def test_claimed_once_task_stays_enabled_until_finished():
+    task = _create_task("once")
+
+    ScheduledTaskDAO.claim_pending_tasks()
+    running = ScheduledTaskDAO.get_scheduled_task_by_id(task.id)
+    assert running.status == "running"
+    assert running.enabled
+
+    done = ScheduledTaskDAO.update_task_status(task.id, "completed")
+    assert done.status == "completed"
+    assert not done.enabled
+    assert done.run_count == 1
+
+
+def test_claim_skips_tasks_already_running():
+    _create_task("daily")
+
+    assert len(ScheduledTaskDAO.claim_pending_tasks()) == 1
+    assert ScheduledTaskDAO.claim_pending_tasks() == []
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.code_recognition.ocr.tesseract_ocr import EARLY_EXIT_CONFIDENCE, TesseractOCRService
+
+
+@pytest.fixture
+def service():
+    """不依赖本机 Tesseract，识别结果由各用例替换 recognize_text 提供"""
+    service = TesseractOCRService()
+    service.is_initialized = True
+    return service
+
+
+def _stub_recognize_text(monkeypatch, service, confidence):
+    """替换 recognize_text，记录每次收到的图像，返回固定置信度"""
+    received = []
+
+    def recognize_text(image, config=None):
+        received.append(service._process_input_image(image))
+        return {
+            'success': True,
+            'text': 'x = 1',
+            'detailed_results': [],
+            'confidence_stats': {'average': confidence},
+        }
+
+    monkeypatch.setattr(service, 'recognize_text', recognize_text)
+    return received
+
+
+def _screenshot() -> np.ndarray:
+    image = np.full((40, 120, 3), 30, dtype=np.uint8)
+    image[15:25, 10:110] = 220
+    return image
+
+
+def test_enhanced_variant_wins_and_exits_early(monkeypatch, service):
+    received = _stub_recognize_text(monkeypatch, service, EARLY_EXIT_CONFIDENCE)
+
+    result = service.recognize_with_preprocessing_variants(_screenshot())
+
+    assert result['success']
+    assert result['best_preprocessing'] == 'enhanced'
+    assert len(received) == 1
+    assert isinstance(received[0], Image.Image)
+
+
+def test_pil_variants_reach_recognition(monkeypatch, service):
+    received = _stub_recognize_text(monkeypatch, service, EARLY_EXIT_CONFIDENCE - 0.5)
+
+    result = service.recognize_with_preprocessing_variants(_screenshot())
+
+    assert result['success']
+    assert len(received) == 4
+    assert all(isinstance(image, Image.Image) for image in received)